@@ -0,0 +1,161 @@
+#!/usr/bin/env python
+
+"""Enrich downloaded Gerrit changes with their files and comments.
+
+The changes in a file written by get-gerrit-data.py are queried one by one
+with ``--patch-sets --files --comments`` as asyncio subprocesses.  At most
+``--concurrency`` queries run at once and at most ``--rate`` are started per
+second.  Every enriched change is appended to the output as a line of JSON
+as soon as it arrives, and changes already in the output are skipped, so an
+interrupted run can be restarted.
+
+Example::
+
+  enrich-gerrit-data.py -p 22 alice@review.source.kitware.com ../data/gerrit_data.json gerrit_enriched.json
+
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import shlex
+import sys
+
+
+def load_enriched(filename):
+    """Numbers of the changes already in the enriched output."""
+    enriched = set()
+    if not os.path.exists(filename):
+        return enriched
+    with open(filename, 'r') as fp:
+        for line in fp:
+            try:
+                enriched.add(str(json.loads(line)['number']))
+            except ValueError:
+                # Partial line from an interrupted run.
+                continue
+    return enriched
+
+
+class RateLimiter(object):
+    """Space the starts of the server calls at least 1 / rate apart."""
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self.next_start = 0.0
+        self.lock = asyncio.Lock()
+
+    async def wait(self):
+        async with self.lock:
+            loop = asyncio.get_running_loop()
+            now = loop.time()
+            if self.next_start > now:
+                await asyncio.sleep(self.next_start - now)
+                now = self.next_start
+            self.next_start = now + self.interval
+
+
+async def _query_change(command, number, semaphore, rate_limiter, retries,
+                        backoff):
+    ssh_call = command + ['gerrit', 'query', '--format=JSON',
+                          '--all-approvals', '--patch-sets', '--files',
+                          '--comments', 'change:' + str(number)]
+    async with semaphore:
+        for attempt in range(retries + 1):
+            await rate_limiter.wait()
+            process = await asyncio.create_subprocess_exec(
+                *ssh_call, stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE)
+            stdout, stderr = await process.communicate()
+            if process.returncode == 0:
+                break
+            if attempt == retries:
+                raise RuntimeError('Query for change ' + str(number) +
+                                   ' failed: ' +
+                                   stderr.decode('utf-8', 'replace').strip())
+            await asyncio.sleep(backoff * 2**attempt)
+    results = stdout.decode('utf-8').split('\n')
+    try:
+        # The last line is the query statistics.
+        results = [json.loads(rr) for rr in results if rr.strip()][:-1]
+    except ValueError as error:
+        raise ValueError('Invalid reply for change ' + str(number) + ': ' +
+                         str(error))
+    if not results:
+        return None
+    return results[0]
+
+
+async def enrich_changes(changes, command, outputfile, concurrency=8,
+                         rate=10.0, retries=3, backoff=2.0):
+    """Query the details of the changes and append them to outputfile.
+
+    Returns the number of changes that were enriched."""
+    done = load_enriched(outputfile)
+    numbers = [str(cc['number']) for cc in changes
+               if str(cc['number']) not in done]
+    if done:
+        print('Skipping ' + str(len(done)) + ' already enriched changes')
+    semaphore = asyncio.Semaphore(concurrency)
+    rate_limiter = RateLimiter(rate)
+    tasks = [asyncio.ensure_future(_query_change(command, number, semaphore,
+                                                 rate_limiter, retries,
+                                                 backoff))
+             for number in numbers]
+    enriched = 0
+    failed = 0
+    with open(outputfile, 'a') as fp:
+        for task in asyncio.as_completed(tasks):
+            try:
+                change = await task
+            except (RuntimeError, ValueError, OSError) as error:
+                # Count the failure and keep enriching the other changes.
+                failed += 1
+                print('\n' + str(error))
+                continue
+            if change is None:
+                continue
+            fp.write(json.dumps(change) + '\n')
+            fp.flush()
+            enriched += 1
+            sys.stdout.write('Enriched change ' + str(enriched) + ' of ' +
+                             str(len(numbers)) + '\r')
+            sys.stdout.flush()
+    sys.stdout.write('\n')
+    if failed:
+        print(str(failed) + ' changes failed, rerun to retry them')
+    return enriched
+
+
+def main(args):
+    with open(args.gerrit_data, 'r') as fp:
+        changes = json.load(fp)['changes']
+    command = shlex.split(args.ssh_command) + ['-p', str(args.port),
+                                               args.host]
+    asyncio.run(enrich_changes(changes, command, args.outputfile,
+                               args.concurrency, args.rate, args.retries,
+                               args.backoff))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--port', '-p', type=int, default=29418)
+    parser.add_argument('--concurrency', '-j', type=int, default=8,
+        help='Maximum number of concurrent queries.')
+    parser.add_argument('--rate', type=float, default=10.0,
+        help='Maximum number of queries started per second, 0 for no limit.')
+    parser.add_argument('--retries', type=int, default=3,
+        help='Number of retries for a failed query.')
+    parser.add_argument('--backoff', type=float, default=2.0,
+        help='Initial retry delay in seconds, doubled after every failure.')
+    parser.add_argument('--ssh-command', default='ssh',
+        help='Command used to reach the server, e.g. fake-gerrit-server.py for testing.')
+    parser.add_argument('host', help='Host for the Gerrit Code Review instance.')
+    parser.add_argument('gerrit_data',
+        help='Gerrit data JSON file from get-gerrit-data.py.')
+    parser.add_argument('outputfile',
+        help='Output file with one enriched change JSON per line.')
+    args = parser.parse_args()
+    main(args)
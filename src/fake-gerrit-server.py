@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+
+"""Stand-in for the Gerrit ssh query interface, for testing without a server.
+
+It accepts the arguments of ``ssh -p <port> <host> gerrit query ...`` and
+answers from a saved Gerrit data JSON file in the same format as the server:
+one change per line followed by a stats line.  ``change:<number>`` queries
+return that change, other queries return pages of 500 changes ordered by
+sortKey and honor ``resume_sortkey:``.  When ``--files`` or ``--comments``
+are requested and the saved data does not have them, deterministic placeholder
+data is generated.
+
+Example::
+
+  enrich-gerrit-data.py --ssh-command 'python fake-gerrit-server.py --data ../data/gerrit_data.json' host ../data/gerrit_data.json enriched.json
+
+"""
+
+import argparse
+import json
+import random
+import sys
+import time
+
+# Gerrit returns at most this many changes per query.
+page_size = 500
+
+placeholder_paths = ('Modules/Core/Common/include',
+                     'Modules/Core/Common/src',
+                     'Modules/Filtering/ImageGrid/include',
+                     'Modules/Filtering/Smoothing/include',
+                     'Modules/IO/ImageBase/src',
+                     'Modules/Registration/Common/include',
+                     'Documentation',
+                     'CMake')
+
+
+def _add_placeholders(change, files, comments):
+    generator = random.Random(change['number'])
+    for patch_set in change.get('patchSets', []):
+        if files and 'files' not in patch_set:
+            paths = generator.sample(placeholder_paths, 2)
+            patch_set['files'] = [
+                {'file': path + '/File' + str(generator.randint(0, 20)) +
+                 '.cxx', 'type': 'MODIFIED'} for path in paths]
+        if comments and 'comments' not in patch_set:
+            patch_set['comments'] = [
+                {'file': patch_set['files'][0]['file'] if files else
+                 '/COMMIT_MSG', 'line': generator.randint(1, 200),
+                 'reviewer': approval['by'], 'message': 'Comment.'}
+                for approval in patch_set.get('approvals', [])]
+
+
+def query(changes, terms, files=False, comments=False):
+    """Select the changes for the query terms the way Gerrit would."""
+    changes = sorted(changes, key=lambda cc: cc['sortKey'], reverse=True)
+    numbers = [tt.split(':', 1)[1] for tt in terms
+               if tt.startswith('change:')]
+    if numbers:
+        selected = [cc for cc in changes if str(cc['number']) in numbers]
+    else:
+        resume = [tt.split(':', 1)[1] for tt in terms
+                  if tt.startswith('resume_sortkey:')]
+        if resume:
+            changes = [cc for cc in changes if cc['sortKey'] < resume[0]]
+        selected = changes[:page_size]
+    for change in selected:
+        _add_placeholders(change, files, comments)
+    return selected
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, allow_abbrev=False,
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--data', required=True,
+        help='Gerrit data JSON file to serve.')
+    parser.add_argument('--delay', type=float, default=0.0,
+        help='Seconds to wait before answering, to simulate latency.')
+    parser.add_argument('--fail-rate', type=float, default=0.0,
+        help='Fraction of calls that fail like a dropped connection.')
+    args, ssh_args = parser.parse_known_args()
+
+    time.sleep(args.delay)
+    if random.random() < args.fail_rate:
+        sys.stderr.write('Connection reset by peer\n')
+        sys.exit(255)
+    with open(args.data, 'r') as fp:
+        changes = json.load(fp)['changes']
+    terms = ssh_args[ssh_args.index('query') + 1:]
+    start = time.time()
+    selected = query(changes, terms, '--files' in terms,
+                     '--comments' in terms)
+    for change in selected:
+        print(json.dumps(change))
+    print(json.dumps({'type': 'stats',
+                      'rowCount': len(selected),
+                      'runTimeMilliseconds':
+                          int(1000 * (time.time() - start))}))
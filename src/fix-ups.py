@@ -1,21 +1,51 @@
 #!/usr/bin/env python
 
+"""Count the fix-up commits that follow each commit in the ITK history.
+
+A followup commit within fixup_days of a commit that modifies lines the commit
+added is considered a fix-up.  Two detection engines are available: 'blame'
+uses git blame and git blame --reverse, 'diff' maps the line ranges from
+zero-context diffs and avoids blame altogether.
+
+Example::
+
+  fix-ups.py --engine diff
+  fix-ups.py --validate 100
+  fix-ups.py --sample 500
+  fix-ups.py --sweep-days 30
+  fix-ups.py --check-sweep 1 2 5 10
+
+"""
+
+import argparse
+import collections
+import datetime
+import json
+import math
 import os
 from os.path import expanduser
-import pickle
+import random
+import re
 import sys
+import time
 
 import git
 from git.exc import GitCommandError
 
+from fixup_format import write_fixups
+import git_query
+
 
 class FixUpCounter(object):
 
     fixup_days = 5
     fixup_seconds = fixup_days * 24 * 60 * 60
 
-    def __init__(self, git_repo):
+    def __init__(self, git_repo, history=None):
         self.git = git_repo
+        # Optional git_query history used for the commit window, followup
+        # and changed file queries instead of calling git.
+        self.history = history
         # keep track of the the commits that have already been identified as
         # fixup commits so that they are not counted twice.
         self.fixup_commits = set()
@@ -42,10 +72,244 @@ class FixUpCounter(object):
             commit_fixup_counts[commit] = count
         return commit_fixup_counts, self.fixup_commits
 
+    def sampled_fixup_counts(self, fromdate, todate, sample_size, seed=None,
+                             bins=7, z=1.96):
+        """Estimate the fixup count distribution from a stratified sample.
+
+        The commits of interest are stratified by month and by number of
+        touched files, a proportionally allocated random sample with at least
+        one commit per stratum is drawn, and only the sampled commits and
+        their followup chains are analyzed.  A sampled commit that fixes up
+        an earlier commit of interest is not counted.  This approximates how
+        fixup_counts skips fix-ups (see _is_fixup), and the confidence
+        intervals only cover the sampling error, not that approximation.
+        The test only analyzes the files a sampled commit modifies, and the
+        hunks of the preceding commits are cached across the sample.
+
+        Returns the estimated fraction of counted commits per fixup count
+        bin, the last bin collecting the larger counts, and the estimated
+        mean count, with confidence intervals for the given normal quantile
+        z, and the counts of the sampled commits.
+        """
+        strata, times = self._strata(fromdate, todate)
+        allocation = _allocate_sample(strata, sample_size)
+        generator = random.Random(seed)
+        sample = []
+        for key in sorted(strata):
+            for commit in generator.sample(strata[key], allocation[key]):
+                sample.append((key, commit))
+        sample.sort(key=lambda x: times[x[1]])
+        earliest = min(times.values()) if times else 0
+
+        # "(preceding commit, file): hunks" shared by the _is_fixup tests.
+        hunk_cache = dict()
+        sampled_counts = dict()
+        for index, (key, commit) in enumerate(sample):
+            sys.stdout.write('Analyzing sampled commit ' + str(index + 1) +
+                             ' of ' + str(len(sample)) + '\r')
+            sys.stdout.flush()
+            if self._is_fixup(commit, earliest, hunk_cache):
+                sampled_counts[commit] = None
+                continue
+            self.fixup_commits = set()
+            changed_files = self._changed_files(commit)
+            sampled_counts[commit] = self._fixup_count(commit, changed_files)
+        sys.stdout.write('\n')
+
+        estimates = _stratified_estimates(strata, sample, sampled_counts,
+                                          bins, z)
+        estimates['sample_counts'] = dict(
+            (cc, vv) for cc, vv in sampled_counts.items() if vv is not None)
+        return estimates
+
+    def _strata(self, fromdate, todate):
+        """Group the commits of interest by month and touched-file count
+        with a single git log."""
+        # Use the git_query date rule so the window matches the daemon's.
+        log = self.git.log('HEAD', since=str(git_query.timestamp(fromdate)),
+                           until=str(git_query.timestamp(todate)),
+                           no_merges=True, format='%x00%H %ct',
+                           shortstat=True)
+        strata = collections.defaultdict(list)
+        times = dict()
+        for entry in log.split('\x00')[1:]:
+            lines = entry.strip().split('\n')
+            commit, commit_time = lines[0].split()
+            touched = 0
+            match = re.search(r'(\d+) files? changed', entry)
+            if match:
+                touched = int(match.group(1))
+            month = datetime.datetime.utcfromtimestamp(
+                int(commit_time)).strftime('%Y-%m')
+            strata[(month, _touched_files_bucket(touched))].append(commit)
+            times[commit] = int(commit_time)
+        return strata, times
+
+    def _is_fixup(self, commit, earliest, hunk_cache):
+        """Whether the commit fixes up a commit of interest in the
+        preceding fixup_days.
+
+        Every preceding commit is tested for all of its changed files.  In
+        fixup_counts a preceding commit that is itself a fix-up is only
+        analyzed for the files it fixed, so this can flag commits that the
+        full count treats as chain roots, and the estimates can be biased
+        toward fewer counted commits.
+
+        Fix-up detection is independent per file, so only the files that
+        the commit modifies are analyzed, and their hunks are kept in
+        hunk_cache for the other sampled commits."""
+        modified = self._modified_files(commit)
+        for preceding, changed_files in self._preceding_commits(commit,
+                                                                earliest):
+            changed_files = [ff for ff in changed_files if ff in modified]
+            if not changed_files or not self._follows(commit, preceding):
+                continue
+            missing = [ff for ff in changed_files
+                       if (preceding, ff) not in hunk_cache]
+            if missing:
+                hunks = self._hunks(preceding, missing)
+                for ff in missing:
+                    hunk_cache[(preceding, ff)] = hunks.get(ff)
+            hunks = dict((ff, hunk_cache[(preceding, ff)])
+                         for ff in changed_files
+                         if hunk_cache[(preceding, ff)])
+            if hunks and self._was_fixed(preceding, hunks, commit):
+                return True
+        return False
+
+    def _modified_files(self, commit):
+        if self.history is not None:
+            return set(self.history.changed_files(commit, 'M'))
+        modified = self.git.diff(commit + '^!', diff_filter='M',
+                                 name_only=True)
+        return set(ff for ff in modified.split('\n') if ff)
+
+    def _preceding_commits(self, commit, earliest):
+        """Commits in the fixup_days before commit, but not before
+        earliest, with their added or modified files.
+
+        They are taken from every branch, like the followups of
+        _following_commits, so they can include commits that commit does
+        not follow; see _follows."""
+        if self.history is not None:
+            commit_date = self.history.commit(commit)['time']
+            since_date = max(commit_date - self.fixup_seconds, earliest)
+            return [(cc, self._changed_files(cc) or ())
+                    for cc in self.history.window(since_date, commit_date)
+                    if cc != commit]
+        git = self.git
+        try:
+            commit_date = git.show(commit, s=True, format="%ct")
+            since_date = max(int(commit_date) - self.fixup_seconds, earliest)
+            log = git.log('HEAD', since=str(since_date), until=commit_date,
+                          no_merges=True, format='%x00%H', name_only=True,
+                          diff_filter='AM')
+        except GitCommandError:
+            return []
+        preceding_commits = []
+        for entry in log.split('\x00')[1:]:
+            lines = [ll for ll in entry.split('\n') if ll]
+            if lines[0] != commit:
+                preceding_commits.append((lines[0], tuple(
+                    ff for ff in lines[1:] if ff != 'Testing/Data')))
+        return preceding_commits
+
+    def _follows(self, commit, preceding):
+        """Whether commit is among the _following_commits of preceding,
+        given that it is in their time window."""
+        if self.history is not None:
+            return commit in dict(self.history.following(preceding,
+                                                         self.fixup_seconds))
+        # rev-list preceding.. leaves out the history of preceding.
+        try:
+            self.git.merge_base(commit, preceding, is_ancestor=True)
+        except GitCommandError:
+            return True
+        return False
+
+    def fixup_links(self, fromdate, todate, max_days):
+        """Find every fix-up link within max_days and its time gap.
+
+        Unlike fixup_counts, followups that are already fix-ups are still
+        tested, and every commit is analyzed once for all of its changed
+        files, recording which of them each followup fixed.  Fix-up
+        detection is independent per file, so the links hold all the
+        information fixup_counts uses for any window up to max_days and any
+        file set a chain carries; see replay_fixup_counts.
+
+        Returns the commits of interest and a "commit: ((followup,
+        gap_seconds, fixed_files), ...)" dictionary with the followups in
+        chronological order.
+        """
+        fixup_seconds = self.fixup_seconds
+        self.fixup_seconds = max_days * 24 * 60 * 60
+        commits_of_interest = self._commits_of_interest(fromdate, todate)
+        links = dict()
+        try:
+            number_of_commits = len(commits_of_interest)
+            for commit_index, commit in enumerate(commits_of_interest):
+                sys.stdout.write('Linking commit ' + str(commit_index + 1) +
+                                 ' of ' + str(number_of_commits) + '\r')
+                sys.stdout.flush()
+                if not commit:
+                    continue
+                self._collect_links(commit, links)
+        finally:
+            self.fixup_seconds = fixup_seconds
+        sys.stdout.write('\n')
+        return commits_of_interest, links
+
+    def _collect_links(self, commit, links):
+        stack = [commit]
+        while stack:
+            commit = stack.pop()
+            if commit in links:
+                continue
+            commit_time, following_commits = \
+                self._following_commits_with_times(commit)
+            hunks = self._hunks(commit, self._changed_files(commit))
+            commit_links = []
+            for followup, followup_time in following_commits:
+                fixed_files = self._was_fixed(commit, hunks, followup)
+                if fixed_files:
+                    commit_links.append((followup,
+                                         followup_time - commit_time,
+                                         frozenset(fixed_files)))
+                    stack.append(followup)
+            links[commit] = tuple(commit_links)
+
+    def _following_commits_with_times(self, commit):
+        if self.history is not None:
+            return (self.history.commit(commit)['time'],
+                    tuple(self.history.following(commit,
+                                                 self.fixup_seconds)))
+        git = self.git
+        try:
+            commit_date = git.show(commit, s=True, format="%ct")
+        except GitCommandError:
+            return 0, tuple()
+        until_date = int(commit_date) + self.fixup_seconds
+        following_commits = git.log(commit + '..',
+                                    until=str(until_date),
+                                    since=str(commit_date),
+                                    no_merges=True,
+                                    format='%H %ct')
+        following_commits = [(ff.split()[0], int(ff.split()[1]))
+                             for ff in following_commits.split('\n') if ff]
+        # chronological order
+        following_commits.reverse()
+        return int(commit_date), tuple(following_commits)
+
     def _commits_of_interest(self, fromdate, todate):
+        if self.history is not None:
+            # already in chronological order
+            return tuple(self.history.window(fromdate, todate))
+        # Use the git_query date rule so the window matches the daemon's.
+        since = git_query.timestamp(fromdate)
+        until = git_query.timestamp(todate)
         commits_of_interest = self.git.rev_list('HEAD',
-                                                since=fromdate,
-                                                until=todate,
+                                                since=str(since),
+                                                until=str(until),
                                                 no_merges=True)
         commits_of_interest = commits_of_interest.split('\n')
         # chronological order
@@ -60,7 +324,7 @@ class FixUpCounter(object):
             # Don't analyze the subsequent fixup-progression again.
             if followup in self.fixup_commits or not followup:
                 continue
-            fixed_files = self._was_fixed(hunks, followup)
+            fixed_files = self._was_fixed(commit, hunks, followup)
             if fixed_files:
                 follow_count = self._fixup_count(followup, fixed_files)
                 self.fixup_commits.add(followup)
@@ -69,17 +333,24 @@ class FixUpCounter(object):
 
     def _changed_files(self, commit):
         git = self.git
-        changed_files = git.diff(commit + '^!', diff_filter='AM',
-                                 name_only=True)
-        changed_files = changed_files.split('\n')
+        if self.history is not None:
+            changed_files = self.history.changed_files(commit, 'AM')
+        else:
+            changed_files = git.diff(commit + '^!', diff_filter='AM',
+                                     name_only=True)
+            changed_files = changed_files.split('\n')
         # Do not track the submodule -- causes issues with git blame
         if 'Testing/Data' in changed_files:
             changed_files.remove('Testing/Data')
-        if len(changed_files) == 1 and not changed_files[0]:
+        if not changed_files or \
+                (len(changed_files) == 1 and not changed_files[0]):
             return None
         return tuple(changed_files)
 
     def _following_commits(self, commit):
+        if self.history is not None:
+            return tuple(ff for ff, tt in
+                         self.history.following(commit, self.fixup_seconds))
         git = self.git
         try:
             commit_date = git.show(commit, s=True, format="%ct")
@@ -124,7 +395,7 @@ class FixUpCounter(object):
             hunks[changed_file] = (tuple(hh))
         return hunks
 
-    def _was_fixed(self, hunks, followup):
+    def _was_fixed(self, commit, hunks, followup):
         git = self.git
         followup_changed = git.diff(followup + '^!', diff_filter='M',
                                     name_only=True)
@@ -169,20 +440,450 @@ class FixUpCounter(object):
         return None
 
 
-home = expanduser('~')
+def _touched_files_bucket(touched):
+    if touched <= 1:
+        return '0-1'
+    if touched <= 3:
+        return '2-3'
+    if touched <= 10:
+        return '4-10'
+    return '11+'
+
+
+def _allocate_sample(strata, sample_size):
+    """Proportional allocation with at least one commit per stratum."""
+    total = sum(len(commits) for commits in strata.values())
+    allocation = dict()
+    remainders = []
+    for key, commits in strata.items():
+        share = float(sample_size) * len(commits) / total
+        allocation[key] = min(len(commits), max(1, int(share)))
+        remainders.append((share - int(share), key))
+    remaining = sample_size - sum(allocation.values())
+    for remainder, key in sorted(remainders, reverse=True):
+        if remaining <= 0:
+            break
+        if allocation[key] < len(strata[key]):
+            allocation[key] += 1
+            remaining -= 1
+    return allocation
+
+
+def _stratified_estimates(strata, sample, sampled_counts, bins, z):
+    """Stratified ratio estimates over the counted (non-fixup) commits.
+
+    The variance is the linearized ratio estimator variance with the finite
+    population correction.  Strata with a single sampled commit do not
+    contribute to the variance."""
+    by_stratum = collections.defaultdict(list)
+    for key, commit in sample:
+        by_stratum[key].append(sampled_counts[commit])
+
+    def ratio(value):
+        numerator = 0.0
+        denominator = 0.0
+        for key, counts in by_stratum.items():
+            size = len(strata[key])
+            numerator += size * sum(value(cc) for cc in counts
+                                    if cc is not None) / len(counts)
+            denominator += size * sum(1 for cc in counts
+                                      if cc is not None) / float(len(counts))
+        if denominator == 0.0:
+            return 0.0, 0.0, 0.0
+        estimate = numerator / denominator
+        variance = 0.0
+        for key, counts in by_stratum.items():
+            size = len(strata[key])
+            sampled = len(counts)
+            if sampled < 2:
+                continue
+            residuals = [value(cc) - estimate if cc is not None else 0.0
+                         for cc in counts]
+            mean = sum(residuals) / sampled
+            spread = sum((rr - mean)**2 for rr in residuals) / (sampled - 1)
+            variance += size**2 * (1.0 - float(sampled) / size) * \
+                spread / sampled
+        return estimate, math.sqrt(variance) / denominator, denominator
+
+    estimates = {'commits': sum(len(commits) for commits in strata.values()),
+                 'sampled': len(sample),
+                 'strata': len(strata),
+                 'bins': []}
+    for bin_index in range(bins):
+        fraction, error, counted = ratio(
+            lambda cc: 1.0 if min(cc, bins - 1) == bin_index else 0.0)
+        estimates['bins'].append(
+            {'fraction': fraction,
+             'ci': [max(0.0, fraction - z * error),
+                    min(1.0, fraction + z * error)]})
+    mean, error, counted = ratio(float)
+    estimates['mean'] = {'value': mean,
+                         'ci': [mean - z * error, mean + z * error]}
+    estimates['counted_commits'] = counted
+    return estimates
+
+
+def replay_fixup_counts(commits_of_interest, links, fixup_days):
+    """Derive the fixup_counts output for a window of fixup_days from the
+    links found by FixUpCounter.fixup_links with a window at least as
+    large.
+
+    The traversal mirrors fixup_counts, with an explicit stack instead of
+    recursion.  It only follows links with a time gap within the window, and
+    like _fixup_count it carries the files a followup fixed down the chain,
+    so a followup only counts through the files its predecessor was
+    analyzed for."""
+    fixup_seconds = fixup_days * 24 * 60 * 60
+    fixup_commits = set()
+    commit_fixup_counts = dict()
+    for commit in commits_of_interest:
+        if not commit or commit in fixup_commits:
+            continue
+        # Frames of [commit, analyzed files or None for all, next link
+        # index, count].
+        stack = [[commit, None, 0, 0]]
+        while stack:
+            frame = stack[-1]
+            commit_links = links.get(frame[0], ())
+            followup = None
+            while frame[2] < len(commit_links):
+                candidate, gap, fixed_files = commit_links[frame[2]]
+                frame[2] += 1
+                if candidate in fixup_commits or gap > fixup_seconds:
+                    continue
+                if frame[1] is not None:
+                    fixed_files = fixed_files & frame[1]
+                if fixed_files:
+                    followup = candidate
+                    break
+            if followup is not None:
+                stack.append([followup, fixed_files, 0, 0])
+                continue
+            stack.pop()
+            if stack:
+                fixup_commits.add(frame[0])
+                stack[-1][3] = max(frame[3] + 1, stack[-1][3])
+            else:
+                commit_fixup_counts[frame[0]] = frame[3]
+    return commit_fixup_counts, fixup_commits
+
+
+def check_sweep(fixup_counter, fromdate, todate, windows):
+    """Compare replay_fixup_counts with full fixup_counts runs.
+
+    The links are found once with the largest window and replayed for each
+    window.  Returns the windows, in days, whose replayed counts or fix-up
+    commits differ from those of a full run."""
+    commits_of_interest, links = fixup_counter.fixup_links(fromdate, todate,
+                                                           max(windows))
+    fixup_seconds = fixup_counter.fixup_seconds
+    mismatches = []
+    try:
+        for fixup_days in windows:
+            fixup_counter.fixup_seconds = fixup_days * 24 * 60 * 60
+            full = fixup_counter.fixup_counts(fromdate, todate)
+            replayed = replay_fixup_counts(commits_of_interest, links,
+                                           fixup_days)
+            if tuple(full) != replayed:
+                mismatches.append(fixup_days)
+    finally:
+        fixup_counter.fixup_seconds = fixup_seconds
+    sys.stdout.write('\n')
+    return mismatches
+
+
+def window_sweep(commits_of_interest, links, windows, bins=7):
+    """Summarize the fix-up count distribution for each window in days."""
+    sweep = dict()
+    for fixup_days in windows:
+        fixup_counts, fixups = replay_fixup_counts(commits_of_interest, links,
+                                                   fixup_days)
+        counts = list(fixup_counts.values())
+        histogram = collections.Counter(min(cc, bins - 1) for cc in counts)
+        number_of_counts = float(max(len(counts), 1))
+        sweep[fixup_days] = {
+            'counted_commits': len(counts),
+            'fixup_commits': len(fixups),
+            'fractions': [histogram[ii] / number_of_counts
+                          for ii in range(bins)],
+            'mean': sum(counts) / number_of_counts,
+            'max_depth': max(counts) if counts else 0}
+    return sweep
+
+
+class DiffFixUpCounter(FixUpCounter):
+    """FixUpCounter that detects fix-ups from zero-context diffs.
+
+    The lines added by a commit are read from the hunk headers of
+    ``git show -U0 commit``.  They are carried forward to the parent of a
+    followup through the line offsets of ``git diff -U0 commit followup^``,
+    and the followup fixes them if the old side of its own hunks overlaps.
+    The output of ``git show -U0`` is parsed once per commit and cached,
+    since a followup is tested against every commit in the preceding
+    window, so a commit pair costs at most one diff instead of a blame per
+    file.
+    """
+
+    hunk_header = re.compile(r'^@@ -(\d+)(?:,(\d+))? \+(\d+)(?:,(\d+))? @@')
+
+    def __init__(self, git_repo, history=None):
+        super(DiffFixUpCounter, self).__init__(git_repo, history)
+        # "commit: (modified files, hunks)" of the commits shown so far.
+        self._shown = dict()
+
+    def _diff_hunks(self, command, args, modified=None):
+        """Parse "file: ((old_start, old_count, new_start, new_count), ...)"
+        from a zero-context diff printed by git diff or git show.
+
+        When a modified list is passed, the files that keep their path and
+        are neither added nor deleted are appended to it."""
+        # Explicit prefixes so diff.noprefix and diff.mnemonicPrefix do not
+        # change the file headers.
+        kwargs = dict(unified=0, no_color=True, no_ext_diff=True,
+                      src_prefix='a/', dst_prefix='b/')
+        if command == 'show':
+            kwargs['format'] = ''
+        try:
+            diff = getattr(self.git, command)(*args, **kwargs)
+        except GitCommandError:
+            return dict()
+        hunks = dict()
+        current = None
+        old = None
+        for line in diff.split('\n'):
+            if line.startswith('--- '):
+                old = line[6:] if line.startswith('--- a/') else None
+                continue
+            if line.startswith('+++ '):
+                current = line[6:] if line.startswith('+++ b/') else None
+                if current is not None:
+                    hunks.setdefault(current, [])
+                    if modified is not None and old == current:
+                        modified.append(current)
+                continue
+            if current is None or not line.startswith('@@'):
+                continue
+            match = self.hunk_header.match(line)
+            if not match:
+                continue
+            old_start, old_count, new_start, new_count = match.groups()
+            old_count = 1 if old_count is None else int(old_count)
+            new_count = 1 if new_count is None else int(new_count)
+            hunks[current].append((int(old_start), old_count,
+                                   int(new_start), new_count))
+        return hunks
+
+    def _hunks(self, commit, changed_files):
+        hunks = dict()
+        if not changed_files:
+            return hunks
+        diff_hunks = self._commit_hunks(commit)[1]
+        for changed_file in changed_files:
+            added = tuple([(hh[2], hh[3])
+                           for hh in diff_hunks.get(changed_file, ())
+                           if hh[3] > 0])
+            if added:
+                hunks[changed_file] = added
+        return hunks
+
+    @staticmethod
+    def _map_lines(lines, hunks):
+        """Map line numbers of the old side of a diff to the new side.
+
+        Lines that the diff deletes or replaces are dropped."""
+        mapped = set()
+        for line in lines:
+            shift = 0
+            deleted = False
+            for old_start, old_count, new_start, new_count in hunks:
+                if old_count == 0:
+                    # Pure insertion after line old_start.
+                    if line > old_start:
+                        shift += new_count
+                        continue
+                    break
+                if line >= old_start + old_count:
+                    shift += new_count - old_count
+                    continue
+                if line >= old_start:
+                    deleted = True
+                break
+            if not deleted:
+                mapped.add(line + shift)
+        return mapped
+
+    def _commit_hunks(self, commit):
+        """Modified files and hunks of a commit, from one cached git
+        show."""
+        cached = self._shown.get(commit)
+        if cached is None:
+            modified = []
+            commit_hunks = self._diff_hunks('show', (commit,), modified)
+            cached = (tuple(modified), commit_hunks)
+            self._shown[commit] = cached
+        return cached
+
+    def _was_fixed(self, commit, hunks, followup):
+        followup_changed, followup_hunks = self._commit_hunks(followup)
+        candidates = [changed for changed in followup_changed
+                      if changed in hunks]
+        if not candidates:
+            return None
+        intermediate = self._diff_hunks('diff', (commit, followup + '^',
+                                                 '--') + tuple(candidates))
+        fixed_files = []
+        for changed in candidates:
+            added_lines = set()
+            for hh in hunks[changed]:
+                added_lines.update(range(hh[0], hh[0] + hh[1]))
+            added_lines = self._map_lines(added_lines,
+                                          intermediate.get(changed, ()))
+            followup_deleted = set()
+            for hh in followup_hunks.get(changed, ()):
+                followup_deleted.update(range(hh[0], hh[0] + hh[1]))
+            if not followup_deleted.isdisjoint(added_lines):
+                fixed_files.append(changed)
+
+        if len(fixed_files) > 0:
+            return tuple(fixed_files)
+        return None
+
+
+def validate_engines(git_repo, fromdate, todate, sample_size, seed=None,
+                     history=None):
+    """Compare the fix-up links found by the diff engine to those found by
+    the blame engine on a random sample of commits.
+
+    Returns a dictionary with the agreement and the time spent by each
+    engine."""
+    blame_counter = FixUpCounter(git_repo, history)
+    diff_counter = DiffFixUpCounter(git_repo, history)
+    commits = [cc for cc in blame_counter._commits_of_interest(fromdate,
+                                                                todate) if cc]
+    sample = random.Random(seed).sample(commits,
+                                        min(sample_size, len(commits)))
+    results = {'commits': len(sample), 'pairs': 0, 'agree': 0,
+               'blame_only': 0, 'diff_only': 0,
+               'blame_seconds': 0.0, 'diff_seconds': 0.0}
+    for index, commit in enumerate(sample):
+        sys.stdout.write('Validating commit ' + str(index + 1) +
+                         ' of ' + str(len(sample)) + '\r')
+        sys.stdout.flush()
+        changed_files = blame_counter._changed_files(commit)
+        following_commits = [ff for ff in
+                             blame_counter._following_commits(commit) if ff]
+        links = []
+        for name, counter in (('blame', blame_counter),
+                              ('diff', diff_counter)):
+            start = time.time()
+            hunks = counter._hunks(commit, changed_files)
+            fixed = set()
+            for followup in following_commits:
+                if counter._was_fixed(commit, hunks, followup):
+                    fixed.add(followup)
+            results[name + '_seconds'] += time.time() - start
+            links.append(fixed)
+        results['pairs'] += len(following_commits)
+        results['agree'] += len(following_commits) - \
+            len(links[0].symmetric_difference(links[1]))
+        results['blame_only'] += len(links[0] - links[1])
+        results['diff_only'] += len(links[1] - links[0])
+    sys.stdout.write('\n')
+    return results
+
+
+def main(args):
+    repo = git.Repo(args.repo)
+    git_repo = repo.git
+    # Use the git_query daemon when it is running.
+    history = git_query.connect(args.repo)
+
+    if args.validate:
+        results = validate_engines(git_repo, '2007-08-25', '2013-08-25',
+                                   args.validate, args.seed, history)
+        print('Commit pairs compared:  ' + str(results['pairs']))
+        print('Agreeing pairs:         ' + str(results['agree']))
+        print('Found only by blame:    ' + str(results['blame_only']))
+        print('Found only by diff:     ' + str(results['diff_only']))
+        print('Blame engine time [s]:  ' +
+              '{0:0.1f}'.format(results['blame_seconds']))
+        print('Diff engine time [s]:   ' +
+              '{0:0.1f}'.format(results['diff_seconds']))
+        return
+
+    if args.engine == 'diff':
+        fixup_counter = DiffFixUpCounter(git_repo, history)
+    else:
+        fixup_counter = FixUpCounter(git_repo, history)
+    if args.check_sweep:
+        mismatches = check_sweep(fixup_counter, '2007-08-25', '2013-08-25',
+                                 args.check_sweep)
+        print('Windows checked [days]:   ' + str(args.check_sweep))
+        print('Replay differs at [days]: ' + str(mismatches))
+        return
+    if args.sweep_days:
+        windows = range(1, args.sweep_days + 1)
+        # Gerrit use began August 25th, 2010.
+        for name, fromdate, todate in (('Post', '2010-08-25', '2013-08-25'),
+                                       ('Pre', '2007-08-25', '2010-08-25')):
+            print('Starting ' + name.lower() + '-Gerrit window sweep...')
+            commits_of_interest, links = fixup_counter.fixup_links(
+                fromdate, todate, args.sweep_days)
+            sweep = window_sweep(commits_of_interest, links, windows)
+            for fixup_days in windows:
+                print('{0:2d} days: mean {1:0.3g}, max depth {2}'.format(
+                    fixup_days, sweep[fixup_days]['mean'],
+                    sweep[fixup_days]['max_depth']))
+            with open(name + 'GerritSweep.json', 'w') as fp:
+                json.dump({'windows': sweep,
+                           'links': dict((cc, [[ll[0], ll[1], sorted(ll[2])]
+                                               for ll in ff])
+                                         for cc, ff in links.items() if ff)},
+                          fp)
+        return
+
+    if args.sample:
+        # Gerrit use began August 25th, 2010.
+        for name, fromdate, todate in (('Post', '2010-08-25', '2013-08-25'),
+                                       ('Pre', '2007-08-25', '2010-08-25')):
+            print('Starting sampled ' + name.lower() + '-Gerrit analysis...')
+            estimates = fixup_counter.sampled_fixup_counts(
+                fromdate, todate, args.sample, args.seed)
+            for count, fraction in enumerate(estimates['bins']):
+                print('{0} fix-ups: {1:0.3g} [{2:0.3g}, {3:0.3g}]'.format(
+                    count, fraction['fraction'], *fraction['ci']))
+            with open(name + 'GerritSample.json', 'w') as fp:
+                json.dump(estimates, fp, indent=2)
+        return
+
+    # Gerrit use began August 25th, 2010.
+    print('Starting post-Gerrit analysis...')
+    fixup_counts, fixups = fixup_counter.fixup_counts('2010-08-25',
+                                                      '2013-08-25')
+    write_fixups('PostGerrit.fxu', fixup_counts, fixups)
+    print('Starting pre-Gerrit analysis...')
+    fixup_counts, fixups = fixup_counter.fixup_counts('2007-08-25',
+                                                      '2010-08-25')
+    write_fixups('PreGerrit.fxu', fixup_counts, fixups)
 
-# Assumed ITK git repository path.
-repo_path = os.path.join(home, 'src', 'ITK')
-repo = git.Repo(repo_path)
-git_repo = repo.git
 
-fixup_counter = FixUpCounter(git_repo)
-# Gerrit use began August 25th, 2010.
-print('Starting post-Gerrit analysis...')
-fixup_counts, fixups = fixup_counter.fixup_counts('2010-08-25', '2013-08-25')
-with open('PostGerrit.pkl', 'wb') as fp:
-    pickle.dump((fixup_counts, fixups, 2), fp)
-print('Starting pre-Gerrit analysis...')
-fixup_counts, fixups = fixup_counter.fixup_counts('2007-08-25', '2010-08-25')
-with open('PreGerrit.pkl', 'wb') as fp:
-    pickle.dump((fixup_counts, fixups, 2), fp)
+if __name__ == '__main__':
+    home = expanduser('~')
+    parser = argparse.ArgumentParser(description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+    # Assumed ITK git repository path.
+    parser.add_argument('--repo', default=os.path.join(home, 'src', 'ITK'),
+        help='Path to the ITK git repository.')
+    parser.add_argument('--engine', choices=('blame', 'diff'),
+        default='blame', help='Fix-up detection engine.')
+    parser.add_argument('--validate', type=int, default=0, metavar='N',
+        help='Compare the diff engine to the blame engine on N sampled commits.')
+    parser.add_argument('--sample', type=int, default=0, metavar='N',
+        help='Estimate the distributions from a stratified sample of N commits per window.')
+    parser.add_argument('--sweep-days', type=int, default=0, metavar='DAYS',
+        help='Find the fix-up links once with a DAYS window and derive the distributions for every window from 1 to DAYS days.')
+    parser.add_argument('--check-sweep', type=int, nargs='+', metavar='DAYS',
+        help='Compare the --sweep-days replay with full runs at the given windows.')
+    parser.add_argument('--seed', type=int, default=None)
+    args = parser.parse_args()
+    main(args)
@@ -0,0 +1,185 @@
+#!/usr/bin/env python
+
+"""Compact binary storage for the fix-up counts computed by fix-ups.py.
+
+A fix-up file holds the ``(fixup_counts, fixups)`` pair returned by
+``FixUpCounter.fixup_counts`` in fixed-width arrays so that it can be memory
+mapped and individual columns read without parsing the rest of the file.
+
+Layout, all little-endian::
+
+    offset  size       content
+    0       8          magic, b'FIXUPCNT'
+    8       4          uint32 format version
+    12      4          uint32 number of counted commits, n
+    16      4          uint32 number of fix-up commits, m
+    20      12         reserved, zero
+    32      20 * n     binary SHA-1 of the counted commits, sorted
+    ..      2 * n      uint16 fix-up count for each counted commit
+    ..      20 * m     binary SHA-1 of the fix-up commits, sorted
+
+Both SHA columns are sorted so they double as an index: membership and count
+lookups are a binary search on the mapped array.
+
+Example::
+
+    python fixup_format.py ../data/PreGerrit.pkl ../data/PreGerrit.fxu
+
+converts a legacy pickle.  Only convert pickles from a trusted source.
+
+"""
+
+import binascii
+import struct
+import sys
+
+import numpy as np
+
+MAGIC = b'FIXUPCNT'
+VERSION = 1
+HEADER = struct.Struct('<8sIII12x')
+SHA_DTYPE = np.dtype('S20')
+COUNT_DTYPE = np.dtype('<u2')
+
+
+class FixUpData(object):
+    """Memory mapped view of a fix-up file.
+
+    The ``shas``, ``counts`` and ``fixup_shas`` arrays are mapped on first
+    access, so reading only the counts for a histogram does not touch the
+    SHA columns.
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        with open(filename, 'rb') as fp:
+            header = fp.read(HEADER.size)
+        if len(header) < HEADER.size:
+            raise ValueError(filename + ' is too short to be a fix-up file')
+        magic, version, n_commits, n_fixups = HEADER.unpack(header)
+        if magic != MAGIC:
+            raise ValueError(filename + ' is not a fix-up file')
+        if version != VERSION:
+            raise ValueError('Unsupported fix-up file version: ' +
+                             str(version))
+        self.version = version
+        self.n_commits = n_commits
+        self.n_fixups = n_fixups
+        self._shas_offset = HEADER.size
+        self._counts_offset = self._shas_offset + SHA_DTYPE.itemsize * n_commits
+        self._fixups_offset = self._counts_offset + \
+            COUNT_DTYPE.itemsize * n_commits
+        self._shas = None
+        self._counts = None
+        self._fixup_shas = None
+
+    def _map(self, dtype, offset, length):
+        if length == 0:
+            return np.zeros((0,), dtype=dtype)
+        return np.memmap(self.filename, dtype=dtype, mode='r',
+                         offset=offset, shape=(length,))
+
+    @property
+    def shas(self):
+        """Sorted binary SHA-1 of the counted commits."""
+        if self._shas is None:
+            self._shas = self._map(SHA_DTYPE, self._shas_offset,
+                                   self.n_commits)
+        return self._shas
+
+    @property
+    def counts(self):
+        """Number of fix-up commits per counted commit, aligned with shas."""
+        if self._counts is None:
+            self._counts = self._map(COUNT_DTYPE, self._counts_offset,
+                                     self.n_commits)
+        return self._counts
+
+    @property
+    def fixup_shas(self):
+        """Sorted binary SHA-1 of the commits identified as fix-ups."""
+        if self._fixup_shas is None:
+            self._fixup_shas = self._map(SHA_DTYPE, self._fixups_offset,
+                                         self.n_fixups)
+        return self._fixup_shas
+
+    def count(self, hexsha):
+        """Fix-up count of a commit, or None if it was not counted."""
+        index = _search(self.shas, hexsha)
+        if index is None:
+            return None
+        return int(self.counts[index])
+
+    def is_fixup(self, hexsha):
+        """Whether the commit was identified as a fix-up commit."""
+        return _search(self.fixup_shas, hexsha) is not None
+
+    def fixup_counts(self):
+        """The counts as a "hexsha: count" dictionary."""
+        return dict(zip(_hexshas(self.shas), self.counts.tolist()))
+
+    def fixups(self):
+        """The fix-up commits as a set of hexshas."""
+        return set(_hexshas(self.fixup_shas))
+
+
+def _binary_shas(hexshas):
+    raw = [binascii.unhexlify(hh) for hh in hexshas]
+    for hh, rr in zip(hexshas, raw):
+        if len(rr) != SHA_DTYPE.itemsize:
+            raise ValueError('Invalid SHA-1: ' + str(hh))
+    return np.array(raw, dtype=SHA_DTYPE)
+
+
+def _hexshas(shas):
+    # Go through uint8 so trailing zero bytes of an S20 item are not lost.
+    raw = np.ascontiguousarray(shas).view(np.uint8).reshape(-1, 20)
+    return [binascii.hexlify(row.tobytes()).decode('ascii') for row in raw]
+
+
+def _search(shas, hexsha):
+    key = np.array(binascii.unhexlify(hexsha), dtype=SHA_DTYPE)
+    index = int(np.searchsorted(shas, key))
+    if index < len(shas) and shas[index] == key:
+        return index
+    return None
+
+
+def write_fixups(filename, fixup_counts, fixups):
+    """Write the output of FixUpCounter.fixup_counts to a fix-up file."""
+    hexshas = sorted(fixup_counts.keys())
+    counts = np.array([fixup_counts[hh] for hh in hexshas], dtype=np.int64)
+    if len(counts) and (counts.min() < 0 or
+                        counts.max() > np.iinfo(COUNT_DTYPE).max):
+        raise ValueError('Fix-up count out of range for ' + str(COUNT_DTYPE))
+    shas = _binary_shas(hexshas)
+    fixup_shas = _binary_shas(sorted(fixups))
+    with open(filename, 'wb') as fp:
+        fp.write(HEADER.pack(MAGIC, VERSION, len(shas), len(fixup_shas)))
+        fp.write(shas.tobytes())
+        fp.write(counts.astype(COUNT_DTYPE).tobytes())
+        fp.write(fixup_shas.tobytes())
+
+
+def load_fixups(filename):
+    """Open a fix-up file written by write_fixups."""
+    return FixUpData(filename)
+
+
+def convert_pickle(picklefile, outputfile):
+    """Convert a legacy fix-ups.py pickle to the binary format."""
+    import pickle
+    with open(picklefile, 'rb') as fp:
+        if sys.version_info[0] > 2:
+            fixup_counts, fixups = pickle.load(fp, encoding='latin1')[:2]
+        else:
+            fixup_counts, fixups = pickle.load(fp)[:2]
+    write_fixups(outputfile, fixup_counts, fixups)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 3:
+        print('Usage: ' + sys.argv[0] +
+              ' <legacy_fix_ups.pkl> <output_fix_ups.fxu>')
+        sys.exit(1)
+    convert_pickle(sys.argv[1], sys.argv[2])
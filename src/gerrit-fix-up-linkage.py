@@ -0,0 +1,141 @@
+#!/usr/bin/env python
+
+"""Join Gerrit review metrics with the fix-up counts of the merged commits.
+
+The git log is streamed once and the ``Change-Id:`` trailers of the commit
+messages are collected into a "change id: commits" hash index.  Each Gerrit
+change is then looked up by its id, and the fix-up counts from fix-ups.py are
+looked up by commit, so the join is linear in the size of both datasets.
+The result is a CSV table with one row per linked commit.
+
+Example::
+
+  gerrit-fix-up-linkage.py ../data/gerrit_data.json ../data/PostGerrit.fxu gerrit_fix_up_linkage.csv
+
+"""
+
+import argparse
+import collections
+import csv
+import json
+import os
+import re
+import subprocess
+
+from fixup_format import load_fixups
+
+change_id_trailer = re.compile(r'^\s*Change-Id:\s*(I[0-9a-f]{40})\s*$')
+record_separator = '\x1e'
+
+columns = ('change_number', 'change_id', 'owner', 'status', 'created_on',
+           'patch_sets', 'reviewers', 'code_reviews', 'min_code_review',
+           'max_code_review', 'commit', 'fixup_count', 'is_fixup')
+
+
+def change_id_index(repo_path):
+    """Map each Change-Id to the commits whose messages carry it, streaming
+    git log once."""
+    index = collections.defaultdict(list)
+    process = subprocess.Popen(['git', 'log', 'HEAD', '--no-merges',
+                                '--format=' + record_separator + '%H%n%B'],
+                               cwd=repo_path, stdout=subprocess.PIPE,
+                               universal_newlines=True)
+    commit = None
+    for line in process.stdout:
+        if line.startswith(record_separator):
+            commit = line[1:].strip()
+            continue
+        match = change_id_trailer.match(line)
+        if match and commit:
+            index[match.group(1)].append(commit)
+    process.stdout.close()
+    if process.wait() != 0:
+        raise subprocess.CalledProcessError(process.returncode, 'git log')
+    return index
+
+
+def review_metrics(change):
+    """Review metrics of a Gerrit change."""
+    reviewers = set()
+    values = []
+    for patch_set in change['patchSets']:
+        for approval in patch_set.get('approvals', []):
+            if approval.get('description') == 'Code Review' or \
+                    approval.get('type') in ('CRVW', 'Code-Review'):
+                reviewers.add(approval['by'].get('name', 'Unknown'))
+                values.append(int(approval['value']))
+    return {'change_number': change['number'],
+            'change_id': change['id'],
+            'owner': change['owner'].get('name', 'Unknown'),
+            'status': change.get('status', ''),
+            'created_on': change.get('createdOn', ''),
+            'patch_sets': len(change['patchSets']),
+            'reviewers': len(reviewers),
+            'code_reviews': len(values),
+            'min_code_review': min(values) if values else '',
+            'max_code_review': max(values) if values else ''}
+
+
+def link(changes, index, fixup_counts, fixups):
+    """Join the changes with their commits and fix-up counts.
+
+    Yields one row per commit linked to a change.  The fixup_count is empty
+    for commits that were not counted, e.g. because they are fix-ups
+    themselves or outside the analyzed windows."""
+    for change in changes:
+        commits = index.get(change['id'])
+        if not commits:
+            continue
+        metrics = review_metrics(change)
+        for commit in commits:
+            row = dict(metrics)
+            row['commit'] = commit
+            row['fixup_count'] = fixup_counts.get(commit, '')
+            row['is_fixup'] = int(commit in fixups)
+            yield row
+
+
+def main(args):
+    with open(args.gerrit_data, 'r') as fp:
+        changes = json.load(fp)['changes']
+    fixup_counts = dict()
+    fixups = set()
+    for fixup_file in args.fixups:
+        data = load_fixups(fixup_file)
+        fixup_counts.update(data.fixup_counts())
+        fixups.update(data.fixups())
+    index = change_id_index(args.repo)
+    print('Commits with a Change-Id: ' +
+          str(sum(len(commits) for commits in index.values())))
+
+    linked_changes = set()
+    counted = 0
+    rows = 0
+    with open(args.outputfile, 'w') as fp:
+        writer = csv.DictWriter(fp, columns)
+        writer.writeheader()
+        for row in link(changes, index, fixup_counts, fixups):
+            writer.writerow(row)
+            rows += 1
+            linked_changes.add(row['change_id'])
+            if row['fixup_count'] != '':
+                counted += 1
+    print('Changes linked to commits: ' + str(len(linked_changes)) +
+          ' of ' + str(len(changes)))
+    print('Linked commits with fix-up counts: ' + str(counted) + ' of ' +
+          str(rows))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+    # Assumed ITK git repository path.
+    parser.add_argument('--repo',
+        default=os.path.join(os.path.expanduser('~'), 'src', 'ITK'),
+        help='Path to the ITK git repository.')
+    parser.add_argument('gerrit_data', help='Gerrit data JSON file.')
+    parser.add_argument('fixups', nargs='+',
+        help='Fix-up files from fix-ups.py, e.g. PostGerrit.fxu.')
+    parser.add_argument('outputfile', help='Output CSV file.')
+    args = parser.parse_args()
+    main(args)
@@ -1,7 +1,6 @@
 #!/usr/bin/env python
 
 import json
-import pickle
 import sys
 import os
 
@@ -12,6 +11,8 @@ import numpy as np
 import brewer2mpl
 set2 = brewer2mpl.get_map('Set2', 'qualitative', 8).mpl_colors
 
+from fixup_format import load_fixups
+
 #mpl.rcdefaults()
 mpl.rcParams['axes.labelsize'] = 'x-large'
 mpl.rcParams['xtick.labelsize'] = 'large'
@@ -65,17 +66,12 @@ def plot_fixups(pre_gerrit, post_gerrit, outputfile=None):
 if __name__ == '__main__':
     if len(sys.argv) < 3:
         print('Usage: ' + sys.argv[0] +
-              ' <PreGerrit.pkl> <PostGerrit.pkl> [output_file.eps]')
+              ' <PreGerrit.fxu> <PostGerrit.fxu> [output_file.eps]')
         sys.exit(1)
 
-    with open(sys.argv[1], 'rb') as fp:
-        pre_gerrit = pickle.load(fp)[0]
-        pre_gerrit = [vv for vv in pre_gerrit.itervalues()]
-        pre_gerrit = np.array(pre_gerrit)
-    with open(sys.argv[2], 'rb') as fp:
-        post_gerrit = pickle.load(fp)[0]
-        post_gerrit = [vv for vv in post_gerrit.itervalues()]
-        post_gerrit = np.array(post_gerrit)
+    # Only the counts column is read from the memory mapped files.
+    pre_gerrit = np.asarray(load_fixups(sys.argv[1]).counts)
+    post_gerrit = np.asarray(load_fixups(sys.argv[2]).counts)
     if len(sys.argv) > 3:
         outputfile = sys.argv[3]
         dirname = os.path.dirname(outputfile)
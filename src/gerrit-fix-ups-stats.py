@@ -0,0 +1,203 @@
+#!/usr/bin/env python
+
+"""Bootstrap and permutation statistics for pre- vs post-review fix-ups.
+
+Confidence intervals are computed for the fraction of commits in each fix-up
+count bin and for the mean fix-up chain length.  Permutation tests give the
+significance of the post - pre difference.  Resamples are drawn as
+``(batch, n)`` index arrays and reduced with NumPy, so the only Python loop
+is over batches of resamples.  Only the ``RandomState`` generator is used,
+so the script runs with the NumPy and Python versions of the other figure
+scripts.
+
+Several pre/post pairs, e.g. different windows or repositories, can be
+compared in one run by repeating the arguments.
+
+Example::
+
+  gerrit-fix-ups-stats.py --pre ../data/PreGerrit.fxu --post ../data/PostGerrit.fxu fix_up_stats.json
+
+"""
+
+import argparse
+import json
+import os
+
+import numpy as np
+
+from fixup_format import load_fixups
+
+# Limit the number of elements in a batch of resamples to bound memory.
+max_batch_elements = 2**24
+
+
+def _batches(resamples, n):
+    batch_size = max(1, min(resamples, max_batch_elements // max(n, 1)))
+    done = 0
+    while done < resamples:
+        size = min(batch_size, resamples - done)
+        yield size
+        done += size
+
+
+def _bin_fractions(binned, bins):
+    """Fraction of each row of the (batch, n) array of bin indices per bin."""
+    batch, n = binned.shape
+    offsets = (np.arange(batch) * bins)[:, np.newaxis]
+    counts = np.bincount((binned + offsets).ravel(), minlength=batch * bins)
+    return counts.reshape(batch, bins) / float(n)
+
+
+def bootstrap(counts, bins, resamples, rng):
+    """Bootstrap distributions of the bin fractions and the mean.
+
+    Counts greater than or equal to bins - 1 go into the last bin.  Returns
+    a (resamples, bins) array of bin fractions and a (resamples,) array of
+    means.
+    """
+    counts = np.asarray(counts, dtype=np.int64)
+    binned = np.minimum(counts, bins - 1)
+    n = len(counts)
+    fractions = np.empty((resamples, bins))
+    means = np.empty((resamples,))
+    start = 0
+    for size in _batches(resamples, n):
+        index = rng.randint(0, n, size=(size, n))
+        fractions[start:start + size] = _bin_fractions(binned[index], bins)
+        means[start:start + size] = counts[index].mean(axis=1)
+        start += size
+    return fractions, means
+
+
+def permutation_test(pre, post, bins, resamples, rng):
+    """Two-sided permutation p-values for the post - pre differences in the
+    bin fractions and the mean."""
+    pre = np.asarray(pre, dtype=np.int64)
+    post = np.asarray(post, dtype=np.int64)
+    pooled = np.concatenate((pre, post))
+    pooled_binned = np.minimum(pooled, bins - 1)
+    n_pre = len(pre)
+    n_post = len(post)
+    total = pooled.sum()
+    total_bins = np.bincount(pooled_binned, minlength=bins)
+
+    observed_mean = post.mean() - pre.mean()
+    observed_fractions = \
+        np.bincount(pooled_binned[n_pre:], minlength=bins) / float(n_post) - \
+        np.bincount(pooled_binned[:n_pre], minlength=bins) / float(n_pre)
+
+    extreme_mean = 0
+    extreme_fractions = np.zeros((bins,), dtype=np.int64)
+    # Compare with a tolerance so the observed labelling counts as extreme.
+    tolerance = 1e-12
+    for size in _batches(resamples, len(pooled)):
+        # Sorting random keys gives a batch of independent permutations.
+        permuted = np.argsort(rng.random_sample((size, len(pooled))), axis=1)
+        pre_index = permuted[:, :n_pre]
+        pre_sum = pooled[pre_index].sum(axis=1)
+        mean_diff = (total - pre_sum) / float(n_post) - \
+            pre_sum / float(n_pre)
+        extreme_mean += np.count_nonzero(
+            np.abs(mean_diff) >= abs(observed_mean) - tolerance)
+        pre_bins = _bin_fractions(pooled_binned[pre_index], bins) * n_pre
+        fraction_diff = (total_bins - pre_bins) / float(n_post) - \
+            pre_bins / float(n_pre)
+        extreme_fractions += np.count_nonzero(
+            np.abs(fraction_diff) >=
+            np.abs(observed_fractions) - tolerance, axis=0)
+    return ((extreme_fractions + 1) / float(resamples + 1),
+            (extreme_mean + 1) / float(resamples + 1))
+
+
+def _interval(samples, confidence):
+    alpha = (1.0 - confidence) / 2.0
+    low, high = np.percentile(samples, [100 * alpha, 100 * (1 - alpha)],
+                              axis=0)
+    return low, high
+
+
+def _summary(counts, fractions, means, bins, confidence):
+    counts = np.asarray(counts, dtype=np.int64)
+    observed = np.bincount(np.minimum(counts, bins - 1),
+                           minlength=bins) / float(len(counts))
+    low, high = _interval(fractions, confidence)
+    mean_low, mean_high = _interval(means, confidence)
+    return {'commits': int(len(counts)),
+            'bins': [{'fraction': float(observed[ii]),
+                      'ci': [float(low[ii]), float(high[ii])]}
+                     for ii in range(bins)],
+            'mean': {'value': float(counts.mean()),
+                     'ci': [float(mean_low), float(mean_high)]}}
+
+
+def compare(pre, post, bins=7, resamples=20000, confidence=0.95, rng=None):
+    """Bootstrap confidence intervals and permutation p-values for one
+    pre/post pair of fix-up count arrays."""
+    if rng is None:
+        rng = np.random.RandomState()
+    pre_fractions, pre_means = bootstrap(pre, bins, resamples, rng)
+    post_fractions, post_means = bootstrap(post, bins, resamples, rng)
+    bin_p, mean_p = permutation_test(pre, post, bins, resamples, rng)
+
+    result = {'pre': _summary(pre, pre_fractions, pre_means, bins,
+                              confidence),
+              'post': _summary(post, post_fractions, post_means, bins,
+                               confidence)}
+    diff_low, diff_high = _interval(post_fractions - pre_fractions,
+                                    confidence)
+    mean_low, mean_high = _interval(post_means - pre_means, confidence)
+    result['difference'] = {
+        'bins': [{'ci': [float(diff_low[ii]), float(diff_high[ii])],
+                  'p_value': float(bin_p[ii])}
+                 for ii in range(bins)],
+        'mean': {'ci': [float(mean_low), float(mean_high)],
+                 'p_value': float(mean_p)}}
+    return result
+
+
+def main(args):
+    if len(args.pre) != len(args.post):
+        raise ValueError('Each --pre file needs a matching --post file.')
+    rng = np.random.RandomState(args.seed)
+    results = {'bins': args.bins,
+               'resamples': args.resamples,
+               'confidence': args.confidence,
+               'comparisons': []}
+    for pre_file, post_file in zip(args.pre, args.post):
+        pre = np.asarray(load_fixups(pre_file).counts)
+        post = np.asarray(load_fixups(post_file).counts)
+        comparison = compare(pre, post, args.bins, args.resamples,
+                             args.confidence, rng)
+        comparison['pre']['file'] = os.path.basename(pre_file)
+        comparison['post']['file'] = os.path.basename(post_file)
+        results['comparisons'].append(comparison)
+        print(os.path.basename(pre_file) + ' vs ' +
+              os.path.basename(post_file) + ': mean difference ' +
+              '{0:0.3g}, p = {1:0.3g}'.format(
+                  comparison['post']['mean']['value'] -
+                  comparison['pre']['mean']['value'],
+                  comparison['difference']['mean']['p_value']))
+
+    dirname = os.path.dirname(args.outputfile)
+    if dirname and not os.path.exists(dirname):
+        os.makedirs(dirname)
+    with open(args.outputfile, 'w') as fp:
+        json.dump(results, fp, indent=2)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--pre', action='append', required=True,
+        help='Pre-review fix-up file.  May be repeated.')
+    parser.add_argument('--post', action='append', required=True,
+        help='Post-review fix-up file, paired with the --pre in the same position.')
+    parser.add_argument('--bins', type=int, default=7,
+        help='Number of fix-up count bins; the last bin collects the larger counts.')
+    parser.add_argument('--resamples', '-n', type=int, default=20000,
+        help='Number of bootstrap and permutation resamples.')
+    parser.add_argument('--confidence', type=float, default=0.95)
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('outputfile', help='Output JSON file.')
+    args = parser.parse_args()
+    main(args)
@@ -2,14 +2,17 @@
 
 """Do a graph visualization of the Gerrit reviews."""
 
+import argparse
 import collections
+import datetime
 import json
 import os
-import sys
+import random
 
 import numpy as np
 import matplotlib.pyplot as plt
 import matplotlib as mpl
+from matplotlib.collections import LineCollection
 import networkx as nx
 from networkx.readwrite import json_graph
 import prettyplotlib
@@ -141,6 +144,242 @@ def reviewer_graph(changes):
     return graph
 
 
+def _snapshot_label(created_on, period):
+    date = datetime.datetime.utcfromtimestamp(created_on)
+    if period == 'quarter':
+        return '{0}-Q{1}'.format(date.year, (date.month - 1) // 3 + 1)
+    return '{0}-{1:02d}'.format(date.year, date.month)
+
+
+def _snapshot_metrics(label, graph, components, previous_centrality,
+                      top=10):
+    centrality = nx.degree_centrality(graph)
+    deltas = dict((nn, centrality[nn] - previous_centrality.get(nn, 0.0))
+                  for nn in centrality)
+    largest = sorted(deltas.items(), key=lambda x: abs(x[1]), reverse=True)
+    central = sorted(centrality.items(), key=lambda x: x[1], reverse=True)
+    metrics = {'period': label,
+               'nodes': graph.number_of_nodes(),
+               'edges': graph.number_of_edges(),
+               'density': nx.density(graph),
+               'components': components,
+               'most_central': [[nn, cc] for nn, cc in central[:top]],
+               'centrality_deltas': [[nn, dd] for nn, dd in largest[:top]
+                                     if dd != 0.0]}
+    return metrics, centrality
+
+
+def temporal_snapshots(changes, period='month'):
+    """Build the reviewer graph incrementally in createdOn order.
+
+    Yields "(period_label, graph, metrics)" at the end of every month or
+    quarter that has changes.  The graph is updated in place, so copy it if
+    it is kept past the next iteration.  Nodes and edges carry the same
+    attributes as in reviewer_graph.  The weakly connected components are
+    tracked with a union-find, so each snapshot only costs the centrality
+    computation on top of the single pass over the changes.
+    """
+    graph = nx.DiGraph()
+    parents = {}
+    components = [0]
+
+    def find(node):
+        root = node
+        while parents[root] != root:
+            root = parents[root]
+        while parents[node] != root:
+            parents[node], node = root, parents[node]
+        return root
+
+    def add_contributor(contributor):
+        if contributor not in graph:
+            graph.add_node(contributor, weights=0, created=0, reviewed=0)
+            parents[contributor] = contributor
+            components[0] += 1
+
+    centrality = {}
+    label = None
+    for change in sorted(changes, key=lambda cc: cc['createdOn']):
+        change_label = _snapshot_label(change['createdOn'], period)
+        if label is not None and change_label != label:
+            metrics, centrality = _snapshot_metrics(label, graph,
+                                                    components[0],
+                                                    centrality)
+            yield label, graph, metrics
+        label = change_label
+
+        owner = reviewer_identifier(change['owner'])
+        add_contributor(owner)
+        graph.node[owner]['created'] += 1
+        graph.node[owner]['weights'] += 1
+        for patch_set in change['patchSets']:
+            for approval in patch_set.get('approvals', []):
+                reviewer = reviewer_identifier(approval['by'])
+                add_contributor(reviewer)
+                graph.node[reviewer]['reviewed'] += 1
+                if graph.has_edge(reviewer, owner):
+                    edge = graph[reviewer][owner]
+                else:
+                    graph.add_edge(reviewer, owner, count=0, weights=0,
+                                   accumulated_value=0)
+                    edge = graph[reviewer][owner]
+                    reviewer_root = find(reviewer)
+                    owner_root = find(owner)
+                    if reviewer_root != owner_root:
+                        parents[reviewer_root] = owner_root
+                        components[0] -= 1
+                edge['count'] += 1
+                edge['weights'] += 1
+                edge['accumulated_value'] += int(approval['value'])
+
+    if label is not None:
+        metrics, centrality = _snapshot_metrics(label, graph, components[0],
+                                                centrality)
+        yield label, graph, metrics
+
+
+def label_propagation(graph, weight='weights', max_iterations=100, seed=0):
+    """Weighted label propagation communities of the undirected version of
+    the graph.
+
+    Returns a "node: community_index" dictionary.  Each iteration is linear
+    in the number of edges."""
+    generator = random.Random(seed)
+    neighbors = dict((nn, collections.Counter()) for nn in graph)
+    for uu, vv, data in graph.edges(data=True):
+        if uu == vv:
+            continue
+        neighbors[uu][vv] += data.get(weight, 1)
+        neighbors[vv][uu] += data.get(weight, 1)
+    labels = dict((nn, nn) for nn in graph)
+    nodes = sorted(graph.nodes())
+    for iteration in range(max_iterations):
+        generator.shuffle(nodes)
+        changed = False
+        for node in nodes:
+            if not neighbors[node]:
+                continue
+            votes = collections.Counter()
+            for neighbor, ww in neighbors[node].items():
+                votes[labels[neighbor]] += ww
+            best = max(votes.values())
+            candidates = sorted(ll for ll, vv in votes.items() if vv == best)
+            if labels[node] in candidates:
+                continue
+            labels[node] = generator.choice(candidates)
+            changed = True
+        if not changed:
+            break
+    community_index = {}
+    communities = {}
+    for node in sorted(graph.nodes()):
+        communities[node] = community_index.setdefault(labels[node],
+                                                       len(community_index))
+    return communities
+
+
+def coarsen_graph(graph, communities, prefix):
+    """Collapse each community into a super-node.
+
+    Node weights, created and reviewed counts are summed over the members,
+    and edges between communities aggregate their count, weights and
+    accumulated_value.  Weights of edges inside a community are kept as the
+    internal_weights node attribute."""
+    coarse = nx.DiGraph()
+    members = collections.defaultdict(list)
+    for node, community in communities.items():
+        members[community].append(node)
+    names = {}
+    for community, community_members in sorted(members.items()):
+        name = '{0}{1}'.format(prefix, community)
+        names[community] = name
+        heaviest = max(community_members,
+                       key=lambda nn: (graph.node[nn].get('weights', 0),
+                                       str(nn)))
+        coarse.add_node(name,
+                        name=graph.node[heaviest].get('name', heaviest),
+                        members=sorted(community_members),
+                        size=sum(graph.node[nn].get('size', 1)
+                                 for nn in community_members),
+                        weights=sum(graph.node[nn].get('weights', 0)
+                                    for nn in community_members),
+                        created=sum(graph.node[nn].get('created', 0)
+                                    for nn in community_members),
+                        reviewed=sum(graph.node[nn].get('reviewed', 0)
+                                     for nn in community_members),
+                        internal_weights=sum(graph.node[nn].get(
+                            'internal_weights', 0)
+                            for nn in community_members))
+    for uu, vv, data in graph.edges(data=True):
+        cu = names[communities[uu]]
+        cv = names[communities[vv]]
+        if cu == cv:
+            coarse.node[cu]['internal_weights'] += data.get('weights', 0)
+            continue
+        if not coarse.has_edge(cu, cv):
+            coarse.add_edge(cu, cv, count=0, weights=0, accumulated_value=0)
+        edge = coarse[cu][cv]
+        for key in ('count', 'weights', 'accumulated_value'):
+            edge[key] += data.get(key, 0)
+    return coarse
+
+
+def level_of_detail_graphs(graph, max_levels=5, seed=0):
+    """Hierarchy of coarsened graphs, from the contributor graph at level 0
+    to the coarsest community graph.
+
+    Coarsening stops when label propagation no longer merges nodes."""
+    levels = [graph]
+    while len(levels) <= max_levels:
+        current = levels[-1]
+        communities = label_propagation(current, seed=seed)
+        if len(set(communities.values())) >= current.number_of_nodes():
+            break
+        levels.append(coarsen_graph(current, communities,
+                                    'L{0}C'.format(len(levels))))
+        if levels[-1].number_of_nodes() == 1:
+            break
+    return levels
+
+
+def _node_link_json(graph, filename):
+    for nn in graph:
+        graph.node[nn].setdefault('name', nn)
+    with open(filename, 'w') as fp:
+        json.dump(json_graph.node_link_data(graph), fp)
+
+
+def export_level_of_detail(graph, output_dir, max_levels=5, seed=0):
+    """Write the level of detail hierarchy for a viewer.
+
+    Every coarsened level is written to level-<k>.json, and the members of
+    each of its super-nodes, with the edges among them, to
+    community-<k>-<id>.json, so a viewer can expand one community at a time.
+    index.json lists the files of each level."""
+    if not os.path.exists(output_dir):
+        os.makedirs(output_dir)
+    levels = level_of_detail_graphs(graph.copy(), max_levels, seed)
+    index = {'levels': []}
+    for level in range(len(levels) - 1, 0, -1):
+        coarse = levels[level]
+        level_file = 'level-{0}.json'.format(level)
+        _node_link_json(coarse, os.path.join(output_dir, level_file))
+        detail_files = {}
+        for node in coarse:
+            detail = levels[level - 1].subgraph(coarse.node[node]['members'])
+            detail_file = 'community-{0}-{1}.json'.format(level, node)
+            _node_link_json(detail, os.path.join(output_dir, detail_file))
+            detail_files[node] = detail_file
+        index['levels'].append({'level': level,
+                                'file': level_file,
+                                'nodes': coarse.number_of_nodes(),
+                                'edges': coarse.number_of_edges(),
+                                'communities': detail_files})
+    with open(os.path.join(output_dir, 'index.json'), 'w') as fp:
+        json.dump(index, fp, indent=2)
+    return levels
+
+
 def plot_graph(graph, outputfile=None):
     fig_width = 18.0
     golden_mean = (np.sqrt(5)-1.0)/2.0
@@ -180,6 +419,107 @@ def plot_graph(graph, outputfile=None):
         plt.show()
 
 
+def _bundled_edges(graph, pos, communities, bundle_strength, points=12):
+    """Undirected edges with summed weights, drawn as cubic curves routed
+    toward the layout centroids of the communities of their end nodes.
+
+    The inner control points are pulled toward the centroids of the start
+    and end communities, so edges between the same pair of communities
+    bundle together and edges within a community bend toward its center."""
+    weights = collections.Counter()
+    for uu, vv, data in graph.edges(data=True):
+        if uu == vv:
+            continue
+        weights[tuple(sorted((uu, vv)))] += data.get('weights', 0.0)
+    members = collections.defaultdict(list)
+    for node, community in communities.items():
+        members[community].append(pos[node])
+    centroids = dict((community, np.mean(np.array(positions), axis=0))
+                     for community, positions in members.items())
+    tt = np.linspace(0.0, 1.0, points)[:, np.newaxis]
+    curves = []
+    curve_weights = []
+    for (uu, vv), weight in sorted(weights.items()):
+        start = np.asarray(pos[uu])
+        end = np.asarray(pos[vv])
+        first = (1.0 - bundle_strength) * start + \
+            bundle_strength * centroids[communities[uu]]
+        second = (1.0 - bundle_strength) * end + \
+            bundle_strength * centroids[communities[vv]]
+        curves.append((1 - tt)**3 * start + 3 * (1 - tt)**2 * tt * first +
+                      3 * (1 - tt) * tt**2 * second + tt**3 * end)
+        curve_weights.append(weight)
+    return curves, np.array(curve_weights)
+
+
+def plot_bundled_graph(graph, outputfile=None, raster_dpi=150,
+                       label_threshold=0.1, max_vector_edges=5000,
+                       print_width=7.0, bundle_strength=0.6):
+    """Render the graph with a bounded output size.
+
+    Edges are bundled by label_propagation communities and drawn as a single
+    collection.  Nodes with weights below label_threshold times the maximum
+    weight are unlabeled.  With more than max_vector_edges edges, the edges
+    and these light nodes are drawn into one raster layer at raster_dpi when
+    the figure is printed print_width inches wide, the text width of
+    frontiers.tex, while the heavier nodes and their labels remain vector
+    primitives.  Smaller graphs are drawn all vector, which is then the
+    smaller output."""
+    fig_width = 18.0
+    golden_mean = (np.sqrt(5)-1.0)/2.0
+    fig_height = fig_width * golden_mean
+
+    fig, ax = plt.subplots(1, num=1, figsize=(fig_width, fig_height))
+
+    pos = nx.spring_layout(graph, iterations=200)
+    communities = label_propagation(graph)
+
+    curves, curve_weights = _bundled_edges(graph, pos, communities,
+                                           bundle_strength)
+    rasterize = len(curves) > max_vector_edges
+    if len(curves):
+        max_width = 10.0
+        widths = max_width * curve_weights / max(curve_weights.max(), 1.0)
+        ax.add_collection(LineCollection(curves,
+                                         linewidths=np.maximum(widths, 0.25),
+                                         colors='#0E59A2', alpha=0.3,
+                                         zorder=1))
+
+    names = list(graph.nodes())
+    node_weights = np.array([graph.node[nn].get('weights', 0.0)
+                             for nn in names], dtype=np.float64)
+    coordinates = np.array([pos[nn] for nn in names])
+    max_size = 500
+    max_weight = max(node_weights.max(), 1.0)
+    node_sizes = max_size * node_weights / max_weight
+    major = node_weights >= label_threshold * max_weight
+    # Light nodes are drawn below the rasterization zorder with the edges.
+    for selection, zorder in ((~major, 1.5), (major, 2)):
+        if not selection.any():
+            continue
+        ax.scatter(coordinates[selection, 0], coordinates[selection, 1],
+                   s=node_sizes[selection], c='#A0CBE2', alpha=0.5,
+                   linewidths=0.5, zorder=zorder)
+    for ii in np.nonzero(major)[0]:
+        ax.text(coordinates[ii, 0], coordinates[ii, 1], names[ii],
+                fontsize=10, horizontalalignment='center',
+                verticalalignment='center', zorder=3)
+    if rasterize:
+        # Everything below zorder 2 becomes a single image.
+        ax.set_rasterization_zorder(2)
+
+    plt.axis('off')
+    plt.xlim([-0.1, 1.1])
+    plt.ylim([-0.1, 1.1])
+
+    if outputfile:
+        # The dpi only sets the resolution of the raster layer, which is
+        # scaled down by print_width / fig_width when printed.
+        fig.savefig(outputfile, dpi=raster_dpi * print_width / fig_width)
+    else:
+        plt.show()
+
+
 def plot_closeness(graph, closenessfile=None):
     fig, ax = plt.subplots(1)
     undirected = graph.to_undirected()
@@ -198,41 +538,70 @@ def plot_closeness(graph, closenessfile=None):
         plt.show()
 
 
-if __name__ == '__main__':
-    if len(sys.argv) < 2:
-        print('Usage: ' + sys.argv[0] +
-              ' <gerrit_data.json> [output_render.eps] [gerrit_graph.json] [closeness_centrality.eps]')
-        sys.exit(1)
+def _make_parent_dir(filename):
+    dirname = os.path.dirname(filename)
+    if dirname and not os.path.exists(dirname):
+        os.makedirs(dirname)
 
-    gerrit_data = sys.argv[1]
-    with open(gerrit_data, 'r') as fp:
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('gerrit_data', help='Gerrit data JSON file.')
+    parser.add_argument('outputfile', nargs='?',
+        help='Output graph rendering.  Shown interactively if not given.')
+    parser.add_argument('gerrit_json_file', nargs='?',
+        help='Output node-link JSON file of the graph.')
+    parser.add_argument('closenessfile', nargs='?',
+        help='Output closeness centrality plot.')
+    parser.add_argument('--snapshots', metavar='FILE',
+        help='Write per-period metrics of the graph as it grows to this JSON file.')
+    parser.add_argument('--snapshot-period', choices=('month', 'quarter'),
+        default='month')
+    parser.add_argument('--bundled', action='store_true',
+        help='Bundle the edges by community and, for large graphs, rasterize them with the light nodes to bound the size of the rendering.')
+    parser.add_argument('--raster-dpi', type=int, default=150,
+        help='Printed resolution of the raster layer with --bundled.')
+    parser.add_argument('--label-threshold', type=float, default=0.1,
+        help='With --bundled, nodes lighter than this fraction of the heaviest node are unlabeled, and rasterized with the edges.')
+    parser.add_argument('--max-vector-edges', type=int, default=5000,
+        help='With --bundled, rasterize the edges of graphs with more edges than this.')
+    parser.add_argument('--lod-dir', metavar='DIR',
+        help='Write a community-clustered level of detail hierarchy of the graph to this directory.')
+    args = parser.parse_args()
+
+    with open(args.gerrit_data, 'r') as fp:
         data = json.load(fp)
-    if len(sys.argv) > 2:
-        outputfile = sys.argv[2]
-        dirname = os.path.dirname(outputfile)
-        if not os.path.exists(dirname):
-            os.makedirs(dirname)
-    else:
-        outputfile = None
+    if args.outputfile:
+        _make_parent_dir(args.outputfile)
 
     graph = reviewer_graph(data['changes'])
 
-    plot_graph(graph, outputfile)
+    if args.bundled:
+        plot_bundled_graph(graph, args.outputfile, args.raster_dpi,
+                           args.label_threshold, args.max_vector_edges)
+    else:
+        plot_graph(graph, args.outputfile)
 
-    if len(sys.argv) > 3:
-        gerrit_json_file = sys.argv[3]
-        dirname = os.path.dirname(gerrit_json_file)
-        if not os.path.exists(dirname):
-            os.makedirs(dirname)
+    if args.gerrit_json_file:
+        _make_parent_dir(args.gerrit_json_file)
         for nn in graph:
             graph.node[nn]['name'] = nn
-        data = json_graph.node_link_data(graph)
-        with open(gerrit_json_file, 'wb') as fp:
-            json.dump(data, fp)
-
-    if len(sys.argv) > 4:
-        closenessfile = sys.argv[4]
-        dirname = os.path.dirname(closenessfile)
-        if not os.path.exists(dirname):
-            os.makedirs(dirname)
-        plot_closeness(graph, closenessfile)
+        node_link = json_graph.node_link_data(graph)
+        with open(args.gerrit_json_file, 'wb') as fp:
+            json.dump(node_link, fp)
+
+    if args.closenessfile:
+        _make_parent_dir(args.closenessfile)
+        plot_closeness(graph, args.closenessfile)
+
+    if args.lod_dir:
+        export_level_of_detail(graph, args.lod_dir)
+
+    if args.snapshots:
+        _make_parent_dir(args.snapshots)
+        snapshots = [metrics for label, snapshot, metrics in
+                     temporal_snapshots(data['changes'],
+                                        args.snapshot_period)]
+        with open(args.snapshots, 'w') as fp:
+            json.dump({'period': args.snapshot_period,
+                       'snapshots': snapshots}, fp, indent=2)
@@ -0,0 +1,161 @@
+#!/usr/bin/env python
+
+"""Index who reviews changes under each directory for review routing.
+
+The index is built in one pass over Gerrit changes that have their touched
+files, i.e. the output of enrich-gerrit-data.py.  For every directory prefix
+of the touched paths it counts the changes each reviewer gave a Code Review
+approval on, excluding the change owner.  It is saved as JSON keyed by
+prefix, so a query is one dictionary lookup for the longest indexed prefix
+of the path.
+
+Example::
+
+  gerrit-path-reviewers.py build gerrit_enriched.json path_reviewers.json
+  gerrit-path-reviewers.py query path_reviewers.json Modules/Filtering/Smoothing
+
+"""
+
+import argparse
+import collections
+import json
+import posixpath
+
+index_version = 1
+code_review_types = ('CRVW', 'Code-Review')
+
+
+def load_changes(filename):
+    """Read changes from a get-gerrit-data.py JSON file or from the one
+    change per line output of enrich-gerrit-data.py."""
+    with open(filename, 'r') as fp:
+        first = fp.readline()
+        try:
+            record = json.loads(first)
+        except ValueError:
+            record = None
+        if record is not None and 'changes' not in record:
+            changes = [record]
+            changes.extend(json.loads(line) for line in fp if line.strip())
+            return changes
+        fp.seek(0)
+        return json.load(fp)['changes']
+
+
+def path_prefixes(path):
+    """Directory prefixes of a path, from the root '' to its directory."""
+    parts = path.strip('/').split('/')[:-1]
+    return [''] + ['/'.join(parts[:ii]) for ii in range(1, len(parts) + 1)]
+
+
+def _reviewers(change):
+    owner = change['owner'].get('name', 'Unknown')
+    reviewers = set()
+    for patch_set in change['patchSets']:
+        for approval in patch_set.get('approvals', []):
+            if approval.get('description') != 'Code Review' and \
+                    approval.get('type') not in code_review_types:
+                continue
+            reviewer = approval['by'].get('name', 'Unknown')
+            if reviewer != owner:
+                reviewers.add(reviewer)
+    return reviewers
+
+
+def _touched_paths(change):
+    paths = set()
+    for patch_set in change['patchSets']:
+        for changed in patch_set.get('files', []):
+            if not changed['file'].startswith('/'):
+                paths.add(changed['file'])
+    return paths
+
+
+class PathReviewerIndex(object):
+    """Per directory prefix reviewer counts."""
+
+    def __init__(self, prefixes=None):
+        # "prefix: [(reviewer, count), ...]" sorted by decreasing count.
+        self.prefixes = prefixes or {}
+
+    @classmethod
+    def build(cls, changes):
+        counts = collections.defaultdict(collections.Counter)
+        for change in changes:
+            reviewers = _reviewers(change)
+            if not reviewers:
+                continue
+            prefixes = set()
+            for path in _touched_paths(change):
+                prefixes.update(path_prefixes(path))
+            for prefix in prefixes:
+                counts[prefix].update(reviewers)
+        prefixes = dict((prefix, sorted(counter.items(),
+                                        key=lambda x: (-x[1], x[0])))
+                        for prefix, counter in counts.items())
+        return cls(prefixes)
+
+    @classmethod
+    def load(cls, filename):
+        with open(filename, 'r') as fp:
+            data = json.load(fp)
+        if data.get('version') != index_version:
+            raise ValueError('Unsupported path reviewer index version: ' +
+                             str(data.get('version')))
+        prefixes = dict((prefix, [tuple(rr) for rr in reviewers])
+                        for prefix, reviewers in data['prefixes'].items())
+        return cls(prefixes)
+
+    def save(self, filename):
+        with open(filename, 'w') as fp:
+            json.dump({'version': index_version,
+                       'prefixes': self.prefixes}, fp)
+
+    def reviewers(self, path, top=None):
+        """Reviewers of the longest indexed directory prefix of the path.
+
+        Returns the prefix and its "(reviewer, count)" list."""
+        prefix = posixpath.normpath(path.strip('/'))
+        if prefix == '.':
+            prefix = ''
+        while prefix not in self.prefixes and prefix:
+            prefix = posixpath.dirname(prefix)
+        reviewers = self.prefixes.get(prefix, [])
+        if top is not None:
+            reviewers = reviewers[:top]
+        return prefix, reviewers
+
+
+def main(args):
+    if args.command == 'build':
+        index = PathReviewerIndex.build(load_changes(args.changes))
+        index.save(args.index)
+        print('Indexed ' + str(len(index.prefixes)) + ' directory prefixes')
+    else:
+        index = PathReviewerIndex.load(args.index)
+        for path in args.paths:
+            prefix, reviewers = index.reviewers(path, args.top)
+            print((prefix or '/') + ':')
+            for reviewer, count in reviewers:
+                print('  {0:6d}  {1}'.format(count, reviewer))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest='command')
+    subparsers.required = True
+    build_parser = subparsers.add_parser('build',
+        help='Build the index from changes with touched files.')
+    build_parser.add_argument('changes',
+        help='Enriched changes from enrich-gerrit-data.py.')
+    build_parser.add_argument('index', help='Output index JSON file.')
+    query_parser = subparsers.add_parser('query',
+        help='Print the reviewers of paths.')
+    query_parser.add_argument('--top', '-n', type=int, default=10,
+        help='Number of reviewers to print per path.')
+    query_parser.add_argument('index', help='Index JSON file.')
+    query_parser.add_argument('paths', nargs='+',
+        help='Paths in the repository, e.g. Modules/Filtering.')
+    args = parser.parse_args()
+    main(args)
@@ -4,7 +4,8 @@
 
 import json
 import os
-import subprocess
+
+from git_query import open_history
 
 gerrit_results = {}
 
@@ -27,26 +28,12 @@ for change in changes:
 gerrit_results['reviews'] = reviews
 gerrit_results['max_reviews'] = max_reviews
 
-cwd = os.getcwd()
 itk_src = os.path.join(os.getenv('HOME'), 'src', 'ITK')
-os.chdir(itk_src)
-pre_gerrit_commits = subprocess.check_output(['git',
-    'rev-list',
-    'HEAD',
-    '--since=2007-08-25',
-    '--until=2010-08-25',
-    '--no-merges',
-    '--count'])
-gerrit_results['pre_gerrit_commits'] = pre_gerrit_commits.strip()
-post_gerrit_commits = subprocess.check_output(['git',
-    'rev-list',
-    'HEAD',
-    '--since=2010-08-25',
-    '--until=2013-08-25',
-    '--no-merges',
-    '--count'])
-gerrit_results['post_gerrit_commits'] = post_gerrit_commits.strip()
-os.chdir(cwd)
+history = open_history(itk_src)
+gerrit_results['pre_gerrit_commits'] = str(history.count('2007-08-25',
+                                                         '2010-08-25'))
+gerrit_results['post_gerrit_commits'] = str(history.count('2010-08-25',
+                                                          '2013-08-25'))
 
 with open('gerrit_results.json', 'wb') as fp:
     json.dump(gerrit_results, fp)
@@ -9,49 +9,118 @@ Example::
 """
 
 import argparse
+import glob
 import json
+import os
+import shutil
 import subprocess
+import time
 
+# Gerrit returns at most this many changes per query.
+page_size = 500
 
-def get_changes(host, port, query):
+
+def _page_filename(checkpoint_dir, index):
+    return os.path.join(checkpoint_dir, 'page-{0:05d}.json'.format(index))
+
+
+def load_pages(checkpoint_dir, query):
+    """Load the pages saved by a previous, possibly interrupted, run."""
+    pages = []
+    if not checkpoint_dir or not os.path.exists(checkpoint_dir):
+        return pages
+    for filename in sorted(glob.glob(os.path.join(checkpoint_dir,
+                                                  'page-*.json'))):
+        with open(filename, 'r') as fp:
+            page = json.load(fp)
+        if page['query'] != query:
+            raise ValueError(filename + ' was saved for a different query: ' +
+                             page['query'])
+        pages.append(page)
+    return pages
+
+
+def remove_pages(checkpoint_dir):
+    """Remove the saved pages so the next run downloads from the start."""
+    if checkpoint_dir and os.path.exists(checkpoint_dir):
+        shutil.rmtree(checkpoint_dir)
+
+
+def save_page(checkpoint_dir, index, page):
+    """Save a page so that an interrupted download can be resumed."""
+    if not os.path.exists(checkpoint_dir):
+        os.makedirs(checkpoint_dir)
+    filename = _page_filename(checkpoint_dir, index)
+    # Write then rename so a partial page is never taken as complete.
+    with open(filename + '.tmp', 'w') as fp:
+        json.dump(page, fp)
+    os.rename(filename + '.tmp', filename)
+
+
+def get_changes(host, port, query, checkpoint_dir=None, retries=5,
+                backoff=2.0):
     """Download the changes from the Gerrit server and return the JSON data
-    structure."""
+    structure.
+
+    When checkpoint_dir is given, every page of results is saved there as it
+    arrives along with its sortKey and statistics, and pages found there are
+    not downloaded again.  If they already form a complete walk, e.g. when a
+    run was interrupted before its output was written, the changes are built
+    from them without calling the server.  Failed server calls are retried
+    with exponential backoff."""
     def call_server(query, resume=None):
         ssh_call = ['ssh', '-p', str(port), host, 'gerrit', 'query',
                     '--format=JSON', '--all-approvals']
         ssh_call.extend(query.split())
         if resume:
             ssh_call.append(resume)
-        return subprocess.check_output(ssh_call)
-    query_results = call_server(query)
-    query_results = query_results.split('\n')
-    retrieval_stats = json.loads(query_results[-2])
-    row_count = retrieval_stats['rowCount']
-    runtime = retrieval_stats['runTimeMilliseconds']
-    print('\nNumber of changes retrieved: ' + str(row_count))
-    print('Time for retrieval [msec]:   ' + str(runtime))
-    query_results = query_results[:-2]
-    # There is a limit of 500.
-    def results_to_json(results):
-        results = ','.join(results)
-        json_changes = '{"changes":['
-        json_changes += results
-        json_changes += ']}'
-        json_changes = json.loads(json_changes)
-        return json_changes
-
-    while retrieval_stats['rowCount'] == 500:
-        resume = 'resume_sortkey:' + results_to_json(query_results)['changes'][-1]['sortKey']
-        print(resume)
-        next_results = call_server(query, resume)
-        next_results = next_results.split('\n')
-        retrieval_stats = json.loads(next_results[-2])
+        for attempt in range(retries + 1):
+            try:
+                return subprocess.check_output(ssh_call,
+                                               universal_newlines=True)
+            except (subprocess.CalledProcessError, OSError) as error:
+                if attempt == retries:
+                    raise
+                delay = backoff * 2**attempt
+                print('Server call failed (' + str(error) + '), retrying in ' +
+                      str(delay) + ' seconds')
+                time.sleep(delay)
+
+    pages = load_pages(checkpoint_dir, query)
+    if pages and pages[-1]['stats']['rowCount'] != page_size:
+        print('Using the ' + str(len(pages)) +
+              ' saved pages of a completed download')
+    elif pages:
+        print('Resuming after ' + str(len(pages)) + ' saved pages')
+    row_count = sum(page['stats']['rowCount'] for page in pages)
+    while not pages or pages[-1]['stats']['rowCount'] == page_size:
+        resume = None
+        if pages:
+            resume = 'resume_sortkey:' + pages[-1]['sortKey']
+            print(resume)
+        results = call_server(query, resume)
+        results = results.split('\n')
+        retrieval_stats = json.loads(results[-2])
+        results = results[:-2]
+        sort_key = None
+        if results:
+            sort_key = json.loads(results[-1])['sortKey']
+        page = {'query': query,
+                'resume': resume,
+                'sortKey': sort_key,
+                'stats': retrieval_stats,
+                'rows': results}
+        if checkpoint_dir:
+            save_page(checkpoint_dir, len(pages), page)
+        pages.append(page)
         row_count += retrieval_stats['rowCount']
         runtime = retrieval_stats['runTimeMilliseconds']
         print('\nNumber of changes retrieved: ' + str(row_count))
         print('Time for retrieval [msec]:   ' + str(runtime))
-        next_results = next_results[:-2]
-        query_results.extend(next_results)
+
+    query_results = []
+    for page in pages:
+        query_results.extend(page['rows'])
     query_results = ','.join(query_results)
 
     json_changes = '{"changes":['
@@ -67,13 +136,28 @@ def save_to_file(jsondata, filename):
 
 
 def main(args):
-    changes = get_changes(args.host, args.port, args.query)
+    checkpoint_dir = args.checkpoint_dir
+    if checkpoint_dir is None:
+        checkpoint_dir = args.outputfile + '.pages'
+    if args.fresh:
+        remove_pages(checkpoint_dir)
+    changes = get_changes(args.host, args.port, args.query, checkpoint_dir,
+                          args.retries, args.backoff)
     save_to_file(changes, args.outputfile)
+    remove_pages(checkpoint_dir)
 
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(description=__doc__)
     parser.add_argument('--port', '-p', type=int, default=29418)
+    parser.add_argument('--checkpoint-dir',
+        help='Directory for the downloaded pages.  Defaults to <outputfile>.pages.  Rerun with the same directory to resume an interrupted download.')
+    parser.add_argument('--fresh', action='store_true',
+        help='Discard saved pages and download from the start.')
+    parser.add_argument('--retries', type=int, default=5,
+        help='Number of retries for a failed server call.')
+    parser.add_argument('--backoff', type=float, default=2.0,
+        help='Initial retry delay in seconds, doubled after every failure.')
     parser.add_argument('host', help='Host for the Gerrit Code Review instance.')
     parser.add_argument('query',
         help='Gerrit query to select changes.  See http://gerrit.googlecode.com/svn/documentation/2.2.1/user-search.html')
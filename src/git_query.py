@@ -0,0 +1,334 @@
+#!/usr/bin/env python
+
+"""Answer git history queries from an in-memory commit graph.
+
+The commit graph of HEAD (SHA, parents, commit time, author) is loaded once
+and used to answer commit count, window, ancestry, followup and changed-file
+queries.  It can be served to the analysis scripts by a daemon over a Unix
+socket, so repeated dexy builds and notebooks do not walk the history
+again::
+
+  git_query.py ~/src/ITK &
+
+Scripts call open_history(), which talks to the daemon when it is running and
+otherwise loads the graph in-process.  Requests and responses are one line of
+JSON each, e.g. ``{"query": "count", "args": {"since": "2010-08-25"}}``.
+
+Dates are either seconds since the epoch or ``YYYY-MM-DD``, taken as local
+midnight.  Windows select commits by commit time, like the ``--since`` and
+``--until`` options of git rev-list.  Git itself fills a bare date with the
+current time of day, so scripts that also call git directly convert their
+dates with timestamp() to select the same commits with or without the
+daemon.
+
+"""
+
+import argparse
+import bisect
+import json
+import os
+import signal
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+try:
+    import socketserver
+except ImportError:
+    import SocketServer as socketserver
+
+
+def default_socket_path(repo_path):
+    return os.path.join(repo_path, '.git', 'git-query.sock')
+
+
+def timestamp(date):
+    """Seconds since the epoch of a date given as seconds or YYYY-MM-DD."""
+    if date is None:
+        return None
+    try:
+        return int(date)
+    except ValueError:
+        return int(time.mktime(time.strptime(date, '%Y-%m-%d')))
+
+
+class CommitGraph(object):
+    """Commits reachable from HEAD, loaded with a single git log."""
+
+    def __init__(self, repo_path):
+        self.repo_path = repo_path
+        self._changed_files = dict()
+        self._lock = threading.Lock()
+        self.load()
+
+    def _git(self, *args):
+        return subprocess.check_output(('git',) + args, cwd=self.repo_path,
+                                       universal_newlines=True)
+
+    def load(self):
+        """(Re)load the commit graph from the repository."""
+        log = self._git('log', 'HEAD', '--format=%H%x00%P%x00%ct%x00%an <%ae>')
+        shas = []
+        parents = []
+        times = []
+        authors = []
+        for line in log.split('\n'):
+            if not line:
+                continue
+            sha, parent, commit_time, author = line.split('\x00')
+            shas.append(sha)
+            parents.append(parent.split())
+            times.append(int(commit_time))
+            authors.append(author)
+        self.head = shas[0] if shas else None
+        self.index = dict((sha, ii) for ii, sha in enumerate(shas))
+        self.shas = shas
+        self.parents = [tuple(self.index[pp] for pp in commit_parents
+                              if pp in self.index)
+                        for commit_parents in parents]
+        self.times = times
+        self.authors = authors
+        # Commit indices ordered by time, for window queries.  Commits with
+        # the same time, e.g. from a rebase, are in the reverse of the git
+        # log order, as in reversed git rev-list output.
+        self.by_time = sorted(range(len(shas)),
+                              key=lambda ii: (times[ii], -ii))
+        self.sorted_times = [times[ii] for ii in self.by_time]
+
+    def _range(self, since, until):
+        since = timestamp(since)
+        until = timestamp(until)
+        start = 0
+        end = len(self.by_time)
+        if since is not None:
+            start = bisect.bisect_left(self.sorted_times, since)
+        if until is not None:
+            end = bisect.bisect_right(self.sorted_times, until)
+        return self.by_time[start:end]
+
+    def window(self, since=None, until=None, no_merges=True):
+        """Commits in the time window in chronological order."""
+        return [self.shas[ii] for ii in self._range(since, until)
+                if not (no_merges and len(self.parents[ii]) > 1)]
+
+    def count(self, since=None, until=None, no_merges=True):
+        """Number of commits in the time window."""
+        return len(self.window(since, until, no_merges))
+
+    def is_ancestor(self, ancestor, descendant):
+        """Whether ancestor is reachable from descendant."""
+        target = self.index[ancestor]
+        seen = set()
+        stack = [self.index[descendant]]
+        while stack:
+            current = stack.pop()
+            if current == target:
+                return True
+            if current in seen:
+                continue
+            seen.add(current)
+            stack.extend(pp for pp in self.parents[current]
+                         if pp not in seen)
+        return False
+
+    def _reachable(self, start, since):
+        """Indices reachable from the start indices without going below
+        the commit time since, like the history walk of git rev-list
+        --since."""
+        seen = set()
+        stack = list(start)
+        while stack:
+            current = stack.pop()
+            if current in seen or self.times[current] < since:
+                continue
+            seen.add(current)
+            stack.extend(self.parents[current])
+        return seen
+
+    def following(self, sha, seconds, no_merges=True):
+        """Commits that are not ancestors of sha with a commit time from
+        that of sha to seconds later, like git rev-list sha.. --since
+        --until.
+
+        Returns "(sha, time)" pairs in chronological order."""
+        ii = self.index[sha]
+        since = self.times[ii]
+        ancestors = self._reachable([ii], since)
+        return [(self.shas[jj], self.times[jj])
+                for jj in self._range(since, since + seconds)
+                if jj not in ancestors and
+                not (no_merges and len(self.parents[jj]) > 1)]
+
+    def commit(self, sha):
+        """Parents, commit time and author of a commit."""
+        ii = self.index[sha]
+        return {'sha': sha,
+                'parents': [self.shas[pp] for pp in self.parents[ii]],
+                'time': self.times[ii],
+                'author': self.authors[ii]}
+
+    def changed_files(self, sha, diff_filter=None):
+        """Files changed by a commit, as listed by git diff sha^!.
+
+        The same command as the scripts use without the daemon, so renames
+        are detected the same way.  The name-status of every commit is
+        cached after its first query."""
+        with self._lock:
+            cached = self._changed_files.get(sha)
+        if cached is None:
+            status = self._git('diff', '--name-status', sha + '^!')
+            cached = []
+            for line in status.split('\n'):
+                if line:
+                    fields = line.split('\t')
+                    # Renames and copies list the source path first.
+                    cached.append((fields[0][0], fields[-1]))
+            with self._lock:
+                self._changed_files[sha] = cached
+        return [path for change_type, path in cached
+                if diff_filter is None or change_type in diff_filter]
+
+
+queries = ('window', 'count', 'is_ancestor', 'following', 'commit',
+           'changed_files')
+
+
+class _RequestHandler(socketserver.StreamRequestHandler):
+
+    def handle(self):
+        for line in self.rfile:
+            try:
+                request = json.loads(line.decode('utf-8'))
+                if request['query'] == 'reload':
+                    self.server.graph = CommitGraph(self.server.repo_path)
+                    response = {'result': self.server.graph.head}
+                elif request['query'] in queries:
+                    method = getattr(self.server.graph, request['query'])
+                    response = {'result': method(**request.get('args', {}))}
+                else:
+                    response = {'error': 'Unknown query: ' +
+                                str(request['query'])}
+            except Exception as error:
+                response = {'error': repr(error)}
+            self.wfile.write((json.dumps(response) + '\n').encode('utf-8'))
+            self.wfile.flush()
+
+
+class GitQueryServer(socketserver.ThreadingMixIn,
+                     socketserver.UnixStreamServer):
+    """Serve the CommitGraph of a repository over a Unix socket."""
+
+    daemon_threads = True
+
+    def __init__(self, repo_path, socket_path=None):
+        self.repo_path = repo_path
+        self.graph = CommitGraph(repo_path)
+        if socket_path is None:
+            socket_path = default_socket_path(repo_path)
+        if os.path.exists(socket_path):
+            client = connect(repo_path, socket_path)
+            if client is not None:
+                client.close()
+                raise RuntimeError('A daemon is already serving on ' +
+                                   socket_path)
+            # Left over from a daemon that did not exit cleanly.
+            os.remove(socket_path)
+        socketserver.UnixStreamServer.__init__(self, socket_path,
+                                               _RequestHandler)
+
+
+class GitQueryClient(object):
+    """Client with the same query methods as CommitGraph."""
+
+    def __init__(self, socket_path):
+        self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.socket.connect(socket_path)
+        self.stream = self.socket.makefile('rwb')
+
+    def _request(self, query, **kwargs):
+        request = {'query': query, 'args': kwargs}
+        self.stream.write((json.dumps(request) + '\n').encode('utf-8'))
+        self.stream.flush()
+        response = json.loads(self.stream.readline().decode('utf-8'))
+        if 'error' in response:
+            raise RuntimeError(response['error'])
+        return response['result']
+
+    def window(self, since=None, until=None, no_merges=True):
+        return self._request('window', since=since, until=until,
+                             no_merges=no_merges)
+
+    def count(self, since=None, until=None, no_merges=True):
+        return self._request('count', since=since, until=until,
+                             no_merges=no_merges)
+
+    def is_ancestor(self, ancestor, descendant):
+        return self._request('is_ancestor', ancestor=ancestor,
+                             descendant=descendant)
+
+    def following(self, sha, seconds, no_merges=True):
+        return [tuple(ff) for ff in
+                self._request('following', sha=sha, seconds=seconds,
+                              no_merges=no_merges)]
+
+    def commit(self, sha):
+        return self._request('commit', sha=sha)
+
+    def changed_files(self, sha, diff_filter=None):
+        return self._request('changed_files', sha=sha,
+                             diff_filter=diff_filter)
+
+    def reload(self):
+        return self._request('reload')
+
+    def close(self):
+        self.stream.close()
+        self.socket.close()
+
+
+def connect(repo_path, socket_path=None):
+    """Connect to the daemon for the repository, or return None if it is not
+    running."""
+    if socket_path is None:
+        socket_path = default_socket_path(repo_path)
+    if not os.path.exists(socket_path):
+        return None
+    try:
+        return GitQueryClient(socket_path)
+    except socket.error:
+        return None
+
+
+def open_history(repo_path, socket_path=None):
+    """Query object for the repository history: a daemon client when the
+    daemon is running, otherwise an in-process CommitGraph."""
+    client = connect(repo_path, socket_path)
+    if client is not None:
+        return client
+    return CommitGraph(repo_path)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('repo', nargs='?',
+        default=os.path.join(os.path.expanduser('~'), 'src', 'ITK'),
+        help='Path to the git repository.')
+    parser.add_argument('--socket',
+        help='Unix socket path.  Defaults to <repo>/.git/git-query.sock.')
+    args = parser.parse_args()
+
+    try:
+        server = GitQueryServer(args.repo, args.socket)
+    except RuntimeError as error:
+        sys.exit(str(error))
+    print('Loaded ' + str(len(server.graph.shas)) + ' commits, serving on ' +
+          server.server_address)
+    # Exit through the finally clause to remove the socket on termination.
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    try:
+        server.serve_forever()
+    finally:
+        os.remove(server.server_address)